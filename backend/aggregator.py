@@ -0,0 +1,123 @@
+"""
+Alert Aggregator - Folds repeated alerts of one rule and key into a single alert with a rolling count
+"""
+
+from collections import OrderedDict
+
+from counters import MAX_TRACKED_KEYS
+
+# Seconds an aggregate stays open after its last alert, unless the rule sets 'suppress'
+SUPPRESSION_WINDOW = 300
+
+
+def tier(count):
+    """Escalation tier of a count: 1-9 is tier 1, 10-99 tier 2, 100-999 tier 3, ..."""
+    return len(str(count))
+
+
+class AlertGroup:
+    """An open aggregate: the stored alert plus what has been reported about it"""
+    
+    __slots__ = ('alert', 'window_ms', 'stored_count', 'reported_tier', 'touched')
+    
+    def __init__(self, alert, window_ms):
+        self.alert = alert
+        self.window_ms = window_ms
+        # None until the caller has stored the alert
+        self.stored_count = None
+        self.reported_tier = tier(alert['count'])
+        self.touched = False
+
+
+class AlertAggregator:
+    """Keeps one alert per (rule, key) while its alerts keep coming within the suppression window.
+    
+    Folding an alert into an open aggregate bumps its count and last seen
+    time instead of creating another alert. Open aggregates are kept least
+    recently seen first and bounded like the window counters.
+    """
+    
+    def __init__(self, max_groups=MAX_TRACKED_KEYS):
+        self.max_groups = max_groups
+        # (rule name, key) -> AlertGroup
+        self.groups = OrderedDict()
+        # Groups changed since the last drain, including any closed meanwhile
+        self.touched = []
+        # Newest event time seen, which idle aggregates are closed against
+        self.clock_ms = 0
+    
+    def add(self, alert, key, window_ms):
+        """Fold one alert in; returns it when it opens a new aggregate, else None"""
+        timestamp_ms = alert['timestamp_ms'] or 0
+        self.clock_ms = max(self.clock_ms, timestamp_ms)
+        group_key = (alert['type'], key)
+        group = self.groups.get(group_key)
+        
+        if group is not None and window_ms > 0 and timestamp_ms - group.alert['last_seen_ms'] <= window_ms:
+            aggregate = group.alert
+            aggregate['count'] += 1
+            aggregate['last_seen_ms'] = max(aggregate['last_seen_ms'], timestamp_ms)
+            aggregate['description'] = alert['description']
+            self.groups.move_to_end(group_key)
+            self.touch(group)
+            return None
+        
+        if group is not None:
+            # Too long since the last one; the old aggregate stays as it is
+            del self.groups[group_key]
+        
+        alert['count'] = 1
+        alert['last_seen_ms'] = timestamp_ms
+        group = self.groups[group_key] = AlertGroup(alert, window_ms)
+        self.touch(group)
+        if len(self.groups) > self.max_groups:
+            self.groups.popitem(last=False)
+        return alert
+    
+    def touch(self, group):
+        if not group.touched:
+            group.touched = True
+            self.touched.append(group)
+    
+    def drain(self):
+        """Settle the changes since the last drain; the caller stores the new alerts add returned.
+        
+        Returns (updates, escalations): updates are previously stored alerts
+        whose count changed, to write back; escalations are those among them
+        whose count reached a new tier, to announce.
+        """
+        # Close aggregates idle past their window; the front is least recently seen
+        while self.groups:
+            group = next(iter(self.groups.values()))
+            if group.alert['last_seen_ms'] + group.window_ms >= self.clock_ms:
+                break
+            self.groups.popitem(last=False)
+        
+        updates = []
+        escalations = []
+        for group in self.touched:
+            group.touched = False
+            alert = group.alert
+            if group.stored_count is None:
+                # New since the last drain, so it is stored with its current count
+                group.stored_count = alert['count']
+                group.reported_tier = tier(alert['count'])
+                continue
+            if alert['count'] == group.stored_count:
+                continue
+            group.stored_count = alert['count']
+            updates.append(alert)
+            if tier(alert['count']) > group.reported_tier:
+                group.reported_tier = tier(alert['count'])
+                escalations.append(alert)
+        
+        self.touched = []
+        return updates, escalations
+    
+    def __len__(self):
+        return len(self.groups)
+    
+    def clear(self):
+        self.groups.clear()
+        self.touched = []
+        self.clock_ms = 0
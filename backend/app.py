@@ -1,27 +1,94 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import os
+import tempfile
 import threading
+import time
+from concurrent.futures import wait
+from itertools import islice
 from database import Database
 from parser import LogParser
-from detector import ThreatDetector
+from detector import ThreatDetector, StreamingDetector, RULES_DIR
 from report_generator import ReportGenerator
-from log_monitor import LogMonitor
+from log_monitor import LogMonitor, RuleMonitor
+from ingest import bulk_ingest, SNIFF_LINES
+from rescan import rescan_alerts, parallel_rescan
+from writer import BatchWriter
+from export import EXPORT_FORMATS, LOG_FIELDS, ALERT_FIELDS, encode_rows, gzip_chunks
 
 app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Initialize components
-db = Database()
-parser = LogParser()
-detector = ThreatDetector()
-report_gen = ReportGenerator()
+# Components, built by init_components when the server starts. Parallel ingest and
+# rescan workers import this module afresh and must not open the database, restore
+# detection state or watch files.
+db = None
+detector = None
+parser = None
+report_gen = None
+stream = None
+writer = None
+monitor = None
+rule_monitor = None
+
+def store_logs(logs):
+    """Store new records, detect threats in them and store the alerts.
+    
+    Returns (alerts, updates, escalations) from StreamingDetector.process.
+    """
+    with stream.lock:
+        db.insert_logs(logs)
+        alerts, updates, escalations = stream.process(logs)
+        db.insert_alerts(alerts)
+        db.update_alerts(updates)
+    return alerts, updates, escalations
+
+# Days of logs kept; older days are dropped a whole partition at a time. None keeps everything
+RETENTION_DAYS = None
+
+# Seconds between retention checks
+RETENTION_CHECK_SECONDS = 3600
+
+def expire_logs():
+    """Drop logs older than RETENTION_DAYS with their alerts, and forget those alerts' incidents"""
+    with stream.lock:
+        days = db.expire_logs(RETENTION_DAYS)
+        if days:
+            stream.restore(db.get_alerts(oldest_first=True))
+    if days:
+        print(f" Expired {len(days)} day(s) of logs")
+
+def retention_loop():
+    while True:
+        try:
+            expire_logs()
+        except Exception as e:
+            print(f"Error expiring logs: {e}")
+        time.sleep(RETENTION_CHECK_SECONDS)
+
+# Uploads are parsed and stored in batches of this many records
+UPLOAD_BATCH_SIZE = 5000
+
+# Most worker processes a request may ask for with parallel=
+MAX_WORKERS = os.cpu_count() or 1
+
+# Seconds an upload waits for room in the writer queue before giving up
+UPLOAD_QUEUE_TIMEOUT = 30
+
+# Most records sent to clients per commit; they keep the latest 1000
+LIVE_LOG_LIMIT = 1000
 
 # Log monitoring
 LOG_DIR = '../log/logs'
-os.makedirs(LOG_DIR, exist_ok=True)
+
+# Formats pinned by filename; other files are sniffed from their first lines
+LOG_FORMATS = {
+    'auth.log': 'auth',
+    'apache.log': 'apache',
+    'windows.log': 'windows'
+}
 
 # Stats
 live_stats = {
@@ -30,22 +97,18 @@ live_stats = {
     'alerts_by_severity': {'CRITICAL': 0, 'HIGH': 0, 'MEDIUM': 0}
 }
 
-def process_new_logs(lines, filename):
+def process_new_logs(lines, filename, log_format=None):
     """Process new log lines from monitor"""
-    global live_stats
-    
     # Parse new logs
     content = ''.join(lines)
-    parsed_logs = parser.parse(content, filename)
-    
-    if not parsed_logs:
-        return
-    
-    # Store in database
-    db.insert_logs(parsed_logs)
+    parsed_logs = parser.parse(content, filename, log_format)
     
-    # Detect threats
-    alerts = detector.detect(parsed_logs)
+    # Stored and detected on the writer thread; waits while its queue is full
+    writer.submit(parsed_logs)
+
+def publish_logs(parsed_logs, result):
+    """Update live stats and notify clients after each group commit"""
+    alerts, _, escalations = result
     
     # Update stats
     live_stats['total_logs'] += len(parsed_logs)
@@ -56,15 +119,10 @@ def process_new_logs(lines, filename):
         if severity in live_stats['alerts_by_severity']:
             live_stats['alerts_by_severity'][severity] += 1
     
-    # BUILD TYPE STATS
-    alert_types = {}
-    all_alerts = detector.detect(db.get_all_logs())  # Get all alerts for complete stats
-    for alert in all_alerts:
-        alert_type = alert['type']
-        alert_types[alert_type] = alert_types.get(alert_type, 0) + 1
-    
-    # Update live_stats with type information
-    live_stats['by_type'] = alert_types
+    # Update live_stats with type information, covering every stored log
+    live_stats['by_type'] = dict(stream.by_type)
+    with stream.lock:
+        live_stats['origins'] = stream.sketches.summary()
     live_stats['by_severity'] = live_stats['alerts_by_severity']
     
     # Emit to frontend via WebSocket
@@ -74,23 +132,65 @@ def process_new_logs(lines, filename):
             'count': len(alerts)
         })
     
+    # Repeats only fold into existing alerts; clients hear about them at each tenfold count
+    if escalations:
+        socketio.emit('alert_updates', {
+            'alerts': escalations,
+            'count': len(escalations)
+        })
+    
     socketio.emit('new_logs', {
-        'logs': parsed_logs,
+        'logs': [log.to_dict() for log in parsed_logs[-LIVE_LOG_LIMIT:]],
         'count': len(parsed_logs)
     })
     
+    # Attackers who opened an incident or reached a further stage
+    incidents = stream.drain_incidents()
+    if incidents:
+        socketio.emit('incidents', {
+            'incidents': incidents,
+            'count': len(incidents)
+        })
+    
     # IMPORTANT: Send complete stats
     socketio.emit('stats_update', live_stats)
     
     print(f" Processed {len(parsed_logs)} logs, {len(alerts)} alerts | Stats: {live_stats}")
 
+def on_rules_reloaded(detector):
+    """Point the parser at the new rules' keyword matcher"""
+    parser.keywords = detector.keywords
+    print(f" Rules reloaded: version {detector.ruleset.version}, {len(detector.rules)} rules")
 
-# Start log monitoring in background
-monitor = LogMonitor(LOG_DIR, process_new_logs)
+def init_components():
+    """Open the database, bring live detection up to date and build the writer and monitors"""
+    global db, detector, parser, report_gen, stream, writer, monitor, rule_monitor
+    db = Database()
+    detector = ThreatDetector()
+    # One keyword scan per line serves both severity and rule matching
+    parser = LogParser(detector.keywords)
+    report_gen = ReportGenerator()
+    
+    # Live detection sees each record once and stores its alerts as it goes
+    stream = StreamingDetector(detector)
+    if db.needs_rescan:
+        rescan_alerts(db, stream)
+    else:
+        stream.restore(db.get_alerts(oldest_first=True))
+    
+    # Every producer's records are stored by one thread, in group commits
+    writer = BatchWriter(store_logs, publish_logs)
+    
+    # Log monitoring runs in the background once started
+    os.makedirs(LOG_DIR, exist_ok=True)
+    monitor = LogMonitor(LOG_DIR, process_new_logs, LOG_FORMATS, parser.sniff_format)
+    
+    # Rule files are recompiled on change and swapped in without a restart
+    rule_monitor = RuleMonitor(RULES_DIR, detector, on_rules_reloaded)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'online', 'version': '1.0.0', 'mode': 'LIVE'})
+    return jsonify({'status': 'online', 'version': '1.0.0', 'mode': 'LIVE', 'rule_version': detector.ruleset.version})
 
 @app.route('/upload', methods=['POST'])
 def upload_logs():
@@ -100,30 +200,67 @@ def upload_logs():
             return jsonify({'error': 'No file provided'}), 400
         
         file = request.files['file']
-        content = file.read().decode('utf-8', errors='ignore')
+        parallel = min(request.args.get('parallel', 1, type=int), MAX_WORKERS)
+        futures = []
         
-        parsed_logs = parser.parse(content, file.filename)
-        db.insert_logs(parsed_logs)
+        def submit(batch):
+            future = writer.submit(batch, timeout=UPLOAD_QUEUE_TIMEOUT)
+            if future is None:
+                raise TimeoutError('writer queue full')
+            futures.append(future)
+        
+        if parallel > 1:
+            # Byte-range splitting needs a real file, so spool the upload to disk first
+            fd, tmp_path = tempfile.mkstemp(suffix='.log')
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    file.save(tmp)
+                count = bulk_ingest(tmp_path, db, workers=parallel, filename=file.filename, store=submit)
+            finally:
+                os.remove(tmp_path)
+        else:
+            # Pin the format from the head of the upload, as bulk_ingest does, so whole chunks are parsed at once
+            head = [line.decode('utf-8', errors='ignore') for line in islice(file.stream, SNIFF_LINES)]
+            log_type = parser.sniff_format(head, file.filename)
+            file.stream.seek(0)
+            
+            # Stream the upload through the parser so memory stays flat for large files
+            count = 0
+            for batch in parser.iter_parse(file.stream, file.filename, batch_size=UPLOAD_BATCH_SIZE, log_type=log_type):
+                submit(batch)
+                count += len(batch)
+        
+        # Respond once every batch is stored; a failed commit raises here
+        for future in futures:
+            future.result()
         
         return jsonify({
             'status': 'success',
-            'message': f'Processed {len(parsed_logs)} log entries',
-            'count': len(parsed_logs)
+            'message': f'Processed {count} log entries',
+            'count': count
         })
+    except TimeoutError:
+        # Batches already queued are still committed, so wait for them and count what landed;
+        # batches go in file order, so a retry should send only what follows
+        wait(futures)
+        stored = sum(future.result() for future in futures if future.exception() is None)
+        return jsonify({'error': f'Writer queue full after storing {stored} log entries; retry with the rest',
+                        'count': stored}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/analyze', methods=['GET'])
 def analyze_logs():
     try:
-        logs = db.get_all_logs()
-        alerts = detector.detect(logs)
-        stats = detector.get_statistics(alerts)
+        alerts = db.get_alerts()
+        stats = detector.summarize(*db.alert_counts())
+        with stream.lock:
+            stats['origins'] = stream.sketches.summary()
         
         return jsonify({
             'alerts': alerts,
             'stats': stats,
-            'total_logs': len(logs)
+            'total_logs': db.count_logs()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -132,15 +269,34 @@ def analyze_logs():
 def get_logs():
     try:
         limit = request.args.get('limit', 100, type=int)
-        severity = request.args.get('severity', None)
+        if limit < 1:
+            return jsonify({'error': 'limit must be at least 1'}), 400
+        filters = {
+            'severity': request.args.get('severity', None),
+            'ip_address': request.args.get('ip', None),
+            'log_type': request.args.get('log_type', None),
+            'since': request.args.get('since', None, type=int),
+            'until': request.args.get('until', None, type=int)
+        }
         
-        logs = db.get_logs(limit=limit, severity=severity)
-        total_count = len(db.get_all_logs())
+        # Keyset cursor 'timestamp_ms,id' from next_before; the timestamp is empty for logs without one
+        before = request.args.get('before', None)
+        if before is not None:
+            try:
+                timestamp_ms, log_id = before.split(',')
+                before = (int(timestamp_ms) if timestamp_ms else None, int(log_id))
+            except ValueError:
+                return jsonify({'error': 'before must be <timestamp_ms>,<id>'}), 400
         
+        logs = db.get_logs(limit=limit, before=before, **filters)
+        total_count = db.count_logs(**filters)
+        
+        last = logs[-1] if len(logs) == limit else None
         return jsonify({
-            'logs': logs,
+            'logs': [log.to_dict() for log in logs],
             'total_count': total_count,
-            'returned_count': len(logs)
+            'returned_count': len(logs),
+            'next_before': f"{'' if last.timestamp_ms is None else last.timestamp_ms},{last.id}" if last else None
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -148,28 +304,78 @@ def get_logs():
 @app.route('/timeline', methods=['GET'])
 def get_timeline():
     try:
-        logs = db.get_all_logs()
-        alerts = detector.detect(logs)
-        timeline = detector.generate_timeline(alerts)
+        # Stage by stage events of the furthest advanced incidents, kept up to date as alerts arrive
+        limit = request.args.get('limit', 5, type=int)
+        with stream.lock:
+            timeline = stream.correlator.timeline(limit)
         return jsonify(timeline)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/incidents', methods=['GET'])
+def get_incidents():
+    """Incidents per attacker, furthest kill-chain stage first"""
+    limit = request.args.get('limit', 50, type=int)
+    with stream.lock:
+        incidents = stream.correlator.incidents(limit)
+    return jsonify({'incidents': incidents, 'total_count': len(stream.correlator)})
+
 @app.route('/report', methods=['GET'])
 def generate_report():
     try:
-        logs = db.get_all_logs()
-        alerts = detector.detect(logs)
+        alerts = db.get_alerts()
+        with stream.lock:
+            origins = stream.sketches.summary()
         
-        pdf_path = report_gen.generate_pdf(logs, alerts)
+        pdf_path = report_gen.generate_pdf(db.count_logs(), alerts, origins)
         return send_file(pdf_path, as_attachment=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def export_response(batches, fields, name):
+    """Stream batches of dicts in the requested format, gzipped when asked"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    chunks = encode_rows(batches, fields, export_format)
+    headers = {'Content-Disposition': f'attachment; filename={name}.{export_format}'}
+    if request.args.get('gzip', 0, type=int):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+@app.route('/export/logs', methods=['GET'])
+def export_logs():
+    """Stream logs oldest first as NDJSON or CSV, filtered like /logs"""
+    filters = {
+        'severity': request.args.get('severity', None),
+        'ip_address': request.args.get('ip', None),
+        'log_type': request.args.get('log_type', None),
+        'since': request.args.get('since', None, type=int),
+        'until': request.args.get('until', None, type=int)
+    }
+    batches = ([log.to_dict() for log in logs] for logs in db.stream_logs(**filters))
+    return export_response(batches, LOG_FIELDS, 'logs')
+
+@app.route('/export/alerts', methods=['GET'])
+def export_alerts():
+    """Stream alerts oldest first as NDJSON or CSV, optionally by severity, type and time"""
+    batches = db.stream_alerts(
+        severity=request.args.get('severity', None),
+        type=request.args.get('type', None),
+        since=request.args.get('since', None, type=int),
+        until=request.args.get('until', None, type=int)
+    )
+    return export_response(batches, ALERT_FIELDS, 'alerts')
+
 @app.route('/clear', methods=['POST'])
 def clear_data():
     try:
-        db.clear_all()
+        # Live batches and rescans hold the lock while they touch the tables and the detector state
+        with stream.lock:
+            db.clear_all()
+            stream.reset()
         global live_stats
         live_stats = {
             'total_logs': 0,
@@ -180,11 +386,47 @@ def clear_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/rescan', methods=['POST'])
+def rescan():
+    """Rebuild stored alerts from all logs, e.g. after the rules change"""
+    parallel = min(request.args.get('parallel', 1, type=int), MAX_WORKERS)
+    if parallel > 1:
+        target, kwargs = parallel_rescan, {'workers': parallel}
+    else:
+        target, kwargs = rescan_alerts, {}
+    threading.Thread(target=target, args=(db, stream), kwargs=kwargs, daemon=True).start()
+    return jsonify({'status': 'started', 'message': 'Rescanning stored logs'}), 202
+
+@app.route('/rules/stats', methods=['GET'])
+def get_rule_stats():
+    """Per-rule evaluations, matches, match time and alerts since the last reset"""
+    return jsonify(detector.get_rule_stats())
+
+@app.route('/rules/stats/reset', methods=['POST'])
+def reset_rule_stats():
+    detector.reset_rule_stats()
+    return jsonify({'status': 'success', 'message': 'Rule statistics reset'})
+
 @app.route('/stats', methods=['GET'])
 def get_stats():
     """Get live statistics"""
     return jsonify(live_stats)
 
+@app.route('/stats/writer', methods=['GET'])
+def get_writer_stats():
+    """Writer queue depth, commits and commit latency"""
+    return jsonify(writer.get_stats())
+
+@app.route('/stats/origins', methods=['GET'])
+def get_origins():
+    """Approximate alert counts, distinct and top IPs, users and sources, optionally for a time range"""
+    since = request.args.get('since', None, type=int)
+    until = request.args.get('until', None, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    with stream.lock:
+        origins = stream.sketches.summary(since, until, limit)
+    return jsonify(origins)
+
 @socketio.on('connect')
 def handle_connect():
     print(' Client connected')
@@ -200,11 +442,18 @@ if __name__ == '__main__':
     print(" WebSocket enabled for live updates")
     print("  Starting log monitoring...")
     
-    # Start log monitor
+    init_components()
+    # Start the writer before anything can queue records for it
+    writer.start()
     monitor.start()
+    rule_monitor.start()
+    if RETENTION_DAYS is not None:
+        threading.Thread(target=retention_loop, name='retention', daemon=True).start()
     
     try:
         socketio.run(app, debug=True, port=5000, allow_unsafe_werkzeug=True)
     except KeyboardInterrupt:
         print("\nStopping server...")
-        monitor.stop()
\ No newline at end of file
+        monitor.stop()
+        rule_monitor.stop()
+        writer.stop()
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Benchmark - Measures parser, detector and storage throughput on synthetic corpora
+
+Corpora are built from docs/sample-logs and the MockServer generators in
+log/mock-log-server.py (with sleeps disabled). Results are written as JSON and
+can be compared against a stored baseline run.
+"""
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import types
+from datetime import datetime
+
+from database import Database
+from detector import ThreatDetector
+from parser import LogParser
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'docs', 'sample-logs')
+MOCK_SERVER = os.path.join(ROOT_DIR, 'log', 'mock-log-server.py')
+
+# MockServer methods that produce log lines, normal traffic weighted up
+GENERATORS = [
+    ('generate_normal_auth_logs', 6),
+    ('generate_normal_web_logs', 6),
+    ('generate_normal_windows_logs', 6),
+    ('attack_brute_force', 1),
+    ('attack_sql_injection', 1),
+    ('attack_ransomware', 1),
+    ('attack_data_exfiltration', 1),
+    ('attack_privilege_escalation', 1),
+    ('attack_system_compromise', 1),
+    ('attack_log_tampering', 1),
+    ('attack_suspicious_commands', 1),
+    ('attack_port_scan', 1),
+    ('attack_after_hours_access', 1),
+    ('attack_failed_sudo', 1),
+    ('attack_suspicious_network', 1)
+]
+
+# Mock server log files and sample logs by format
+FILE_FORMATS = {'auth': 'auth', 'apache': 'apache', 'windows': 'windows'}
+
+# Logs per insert in the small-batch storage run, about what one file change brings in
+SMALL_BATCH_SIZE = 100
+
+
+def load_mock_server():
+    """Import log/mock-log-server.py with sleeping disabled"""
+    spec = importlib.util.spec_from_file_location('mock_log_server', MOCK_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.time = types.SimpleNamespace(sleep=lambda seconds: None)
+    return module
+
+
+def build_corpus(size, seed=0):
+    """Lines by format: the sample logs plus generated lines until size is reached"""
+    corpus = {log_format: [] for log_format in FILE_FORMATS.values()}
+    
+    for path in glob.glob(os.path.join(SAMPLE_DIR, '*.log')):
+        for log_format in FILE_FORMATS:
+            if log_format in os.path.basename(path):
+                with open(path) as f:
+                    corpus[log_format].extend(line.rstrip('\n') for line in f if line.strip())
+    
+    random.seed(seed)
+    mock = load_mock_server()
+    with tempfile.TemporaryDirectory() as log_dir:
+        server = mock.MockServer(log_dir)
+        
+        def collect(filepath, message):
+            name = os.path.splitext(os.path.basename(filepath))[0]
+            corpus[FILE_FORMATS[name]].append(message)
+        
+        server.write_log = collect
+        names = [name for name, _ in GENERATORS]
+        weights = [weight for _, weight in GENERATORS]
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            while sum(len(lines) for lines in corpus.values()) < size:
+                getattr(server, random.choices(names, weights)[0])()
+    
+    return corpus
+
+
+def measure(func, items, repeat):
+    """Best-of-repeat timing of func over items"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(items)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    
+    count = len(items)
+    return {
+        'items': count,
+        'seconds': round(best, 6),
+        'per_sec': round(count / best, 1) if best else None,
+        'us_per_item': round(best / count * 1e6, 3) if count else None
+    }, result
+
+
+def bench_parser(corpus, repeat):
+    """Parse throughput per format: pinned, per-line detection, and pinned over a whole buffer"""
+    parser = LogParser()
+    results = {}
+    
+    for log_format, lines in corpus.items():
+        pinned, _ = measure(lambda items: [parser.parse_line(line, '', log_format) for line in items], lines, repeat)
+        detected, _ = measure(lambda items: [parser.parse_line(line) for line in items], lines, repeat)
+        buffer, _ = measure(lambda items: parser.parse_buffer('\n'.join(items), '', log_format), lines, repeat)
+        results[log_format] = {'pinned': pinned, 'detected': detected, 'buffer': buffer}
+    
+    return results
+
+
+def bench_detector(logs, repeat):
+    """Detection throughput overall and for each rule on its own"""
+    detector = ThreatDetector()
+    overall, alerts = measure(detector.detect, logs, repeat)
+    overall['alerts'] = len(alerts)
+    results = {'all_rules': overall, 'rules': {}}
+    
+    for rule_name, rule in list(detector.rules.items()):
+        single = ThreatDetector({rule_name: rule})
+        stats, alerts = measure(single.detect, logs, repeat)
+        stats['alerts'] = len(alerts)
+        results['rules'][rule_name] = stats
+    
+    return results
+
+
+def bench_database(logs, repeat):
+    """Insert throughput in one batch and in small batches, and read-back, against a scratch database"""
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = os.path.join(db_dir, 'bench.db')
+        
+        def insert(items, batch_size=None):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            for log in items:
+                log.id = None
+            db = Database(db_path)
+            batch_size = batch_size or len(items)
+            for start in range(0, len(items), batch_size):
+                db.insert_logs(items[start:start + batch_size])
+            db.close()
+        
+        small_batches, _ = measure(lambda items: insert(items, SMALL_BATCH_SIZE), logs, repeat)
+        inserted, _ = measure(insert, logs, repeat)
+        read, _ = measure(lambda items: Database(db_path).get_all_logs(), logs, repeat)
+    
+    return {'insert': inserted, 'insert_small_batches': small_batches, 'read_all': read}
+
+
+def run(size, repeat, seed=0):
+    """Run every stage and return the results document"""
+    corpus = build_corpus(size, seed)
+    parser = LogParser()
+    logs = [parser.parse_line(line, '', log_format) for log_format, lines in corpus.items() for line in lines]
+    
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'lines': len(logs),
+            'lines_by_format': {log_format: len(lines) for log_format, lines in corpus.items()},
+            'repeat': repeat,
+            'seed': seed
+        },
+        'parser': bench_parser(corpus, repeat),
+        'detector': bench_detector(logs, repeat),
+        'database': bench_database(logs, repeat)
+    }
+
+
+def flatten(results, prefix=''):
+    """Map dotted metric paths to their per_sec value"""
+    metrics = {}
+    for key, value in results.items():
+        if not isinstance(value, dict) or key == 'meta':
+            continue
+        path = f"{prefix}{key}"
+        if 'per_sec' in value:
+            metrics[path] = value['per_sec']
+        else:
+            metrics.update(flatten(value, path + '.'))
+    return metrics
+
+
+def compare(results, baseline):
+    """Print each metric's change against a baseline run"""
+    current = flatten(results)
+    previous = flatten(baseline)
+    
+    print(f"{'metric':<48} {'baseline/s':>14} {'current/s':>14} {'change':>8}")
+    for path, value in current.items():
+        before = previous.get(path)
+        if not before or not value:
+            print(f"{path:<48} {'-':>14} {value or 0:>14,.0f} {'new':>8}")
+            continue
+        print(f"{path:<48} {before:>14,.0f} {value:>14,.0f} {(value / before - 1) * 100:>+7.1f}%")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the LogWatch parser, detector and database')
+    arg_parser.add_argument('-n', '--lines', type=int, default=50000, help='approximate corpus size')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per measurement, best is kept')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed for the generated corpus')
+    arg_parser.add_argument('-o', '--output', help='write results JSON here')
+    arg_parser.add_argument('-b', '--baseline', help='results JSON from an earlier run to compare against')
+    args = arg_parser.parse_args()
+    
+    results = run(args.lines, args.repeat, args.seed)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f" Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    else:
+        for path, value in flatten(results).items():
+            print(f"{path:<48} {value:>14,.0f}/s")
\ No newline at end of file
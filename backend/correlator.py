@@ -0,0 +1,192 @@
+"""
+Kill Chain Correlator - Follows each attacker through the attack stages as their alerts arrive
+"""
+
+from collections import OrderedDict
+
+from counters import MAX_TRACKED_KEYS
+
+# Attack stages in kill-chain order
+KILL_CHAIN = ('reconnaissance', 'initial_access', 'privilege_escalation', 'impact')
+
+# Alert type -> (index into KILL_CHAIN, timeline narrative)
+ATTACK_STAGES = {
+    'port_scan': (0, ' Reconnaissance: Attacker scanned the network for vulnerabilities'),
+    'brute_force': (1, ' Initial Access: Attempted to breach account security'),
+    'privilege_escalation': (2, ' Privilege Escalation: Gained elevated system access'),
+    'file_deletion': (3, ' Impact: Attempted to delete critical files'),
+    'data_exfiltration': (3, 'Exfiltration: Attempted to steal data'),
+    'malware_indicator': (3, ' Malware: Malicious software detected')
+}
+
+# Alert fields that identify an actor
+ACTOR_FIELDS = ('ip_address', 'username')
+
+# Seconds without alerts after which an actor's next alert opens a new incident
+INCIDENT_WINDOW = 24 * 3600
+
+# Seconds an alert with no IP or user may follow the last attributed alert and still join its incident
+UNATTRIBUTED_WINDOW = 15 * 60
+
+# Most incidents kept; the least advanced, least recently advanced go first
+MAX_INCIDENTS = 10000
+
+SEVERITY_ORDER = {'MEDIUM': 1, 'HIGH': 2, 'CRITICAL': 3}
+
+
+class Incident:
+    """One actor's progress through the kill chain"""
+    
+    __slots__ = ('id', 'actors', 'stages', 'stage_alerts', 'severity', 'alert_count', 'first_seen_ms', 'last_seen_ms')
+    
+    def __init__(self, id, timestamp_ms):
+        self.id = id
+        # field -> set of values seen for this actor
+        self.actors = {field: set() for field in ACTOR_FIELDS}
+        # Timeline events, one per stage reached, in the order they were reached
+        self.stages = []
+        # The alert behind each stage event; its id is only known once it is stored
+        self.stage_alerts = []
+        self.severity = None
+        self.alert_count = 0
+        self.first_seen_ms = timestamp_ms
+        self.last_seen_ms = timestamp_ms
+    
+    @property
+    def stage_index(self):
+        return self.stages[-1]['stage_index'] if self.stages else -1
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stage': KILL_CHAIN[self.stage_index],
+            'stages': [event['kill_chain_stage'] for event in self.stages],
+            'severity': self.severity,
+            'alert_count': self.alert_count,
+            'first_seen_ms': self.first_seen_ms,
+            'last_seen_ms': self.last_seen_ms,
+            'actors': {field: sorted(values) for field, values in self.actors.items()},
+            'timeline': [dict(event, alert_id=alert.get('id')) for event, alert in zip(self.stages, self.stage_alerts)]
+        }
+
+
+class KillChainCorrelator:
+    """Groups alerts into incidents by the IP address or user behind them.
+    
+    Each alert costs a few dict lookups: it joins the open incident of any
+    of its actors, or opens one, and advances the incident when its type
+    belongs to a later stage. Host-level alerts that name no IP or user,
+    such as malware found on disk, join the incident seen last if it is
+    recent enough. Incidents are kept ordered by stage reached, so the most
+    advanced ones can be listed without sorting.
+    """
+    
+    def __init__(self, window_ms=INCIDENT_WINDOW * 1000, max_actors=MAX_TRACKED_KEYS, max_incidents=MAX_INCIDENTS):
+        self.window_ms = window_ms
+        self.max_actors = max_actors
+        self.max_incidents = max_incidents
+        self.clear()
+    
+    def clear(self):
+        # (field, value) -> Incident, least recently seen first
+        self.actors = OrderedDict()
+        # One id -> Incident map per stage, least recently advanced first
+        self.by_stage = [OrderedDict() for _ in KILL_CHAIN]
+        # Incidents opened or advanced since the last drain
+        self.changed = {}
+        # Incident of the last alert that named an actor
+        self.latest = None
+        self.next_id = 1
+    
+    def add(self, alert):
+        """Correlate one alert; returns its incident when the alert opened or advanced it"""
+        stage = ATTACK_STAGES.get(alert['type'])
+        if stage is None:
+            return None
+        stage_index, narrative = stage
+        timestamp_ms = alert.get('timestamp_ms') or 0
+        actors = [(field, alert.get(field)) for field in ACTOR_FIELDS if alert.get(field)]
+        
+        if not actors:
+            incident = self.latest
+            if incident is None or not self.is_open(incident, timestamp_ms, UNATTRIBUTED_WINDOW * 1000):
+                return None
+        else:
+            incident = next((self.actors[actor] for actor in actors
+                             if actor in self.actors and self.is_open(self.actors[actor], timestamp_ms)), None)
+            if incident is None:
+                incident = Incident(self.next_id, timestamp_ms)
+                self.next_id += 1
+            self.latest = incident
+        
+        for actor in actors:
+            incident.actors[actor[0]].add(actor[1])
+            self.actors[actor] = incident
+            self.actors.move_to_end(actor)
+        while len(self.actors) > self.max_actors:
+            self.actors.popitem(last=False)
+        
+        incident.alert_count += 1
+        incident.first_seen_ms = min(incident.first_seen_ms, timestamp_ms)
+        incident.last_seen_ms = max(incident.last_seen_ms, timestamp_ms)
+        if SEVERITY_ORDER.get(alert['severity'], 0) > SEVERITY_ORDER.get(incident.severity, 0):
+            incident.severity = alert['severity']
+        if stage_index <= incident.stage_index:
+            return None
+        
+        # Stages may be skipped, since not every step leaves a log line
+        if incident.stages:
+            del self.by_stage[incident.stage_index][incident.id]
+        incident.stages.append({
+            'time': alert.get('timestamp'),
+            'stage': narrative,
+            'description': alert.get('description'),
+            'severity': alert.get('severity'),
+            'details': (alert.get('details') or '')[:100],
+            'kill_chain_stage': KILL_CHAIN[stage_index],
+            'stage_index': stage_index,
+            'timestamp_ms': alert.get('timestamp_ms'),
+            'incident_id': incident.id
+        })
+        incident.stage_alerts.append(alert)
+        self.by_stage[stage_index][incident.id] = incident
+        self.changed[incident.id] = incident
+        self.evict()
+        return incident
+    
+    def is_open(self, incident, timestamp_ms, window_ms=None):
+        """Whether an alert at timestamp_ms still belongs to incident"""
+        return incident.id in self.by_stage[incident.stage_index] and \
+            timestamp_ms - incident.last_seen_ms <= (self.window_ms if window_ms is None else window_ms)
+    
+    def evict(self):
+        """Drop incidents past max_incidents, least advanced first"""
+        excess = sum(len(incidents) for incidents in self.by_stage) - self.max_incidents
+        for incidents in self.by_stage:
+            while excess > 0 and incidents:
+                incident = incidents.popitem(last=False)[1]
+                self.changed.pop(incident.id, None)
+                excess -= 1
+    
+    def incidents(self, limit=None):
+        """Incidents, furthest stage first and most recently advanced first within a stage"""
+        found = []
+        for incidents in reversed(self.by_stage):
+            for incident in reversed(incidents.values()):
+                if limit is not None and len(found) >= limit:
+                    return found
+                found.append(incident.to_dict())
+        return found
+    
+    def timeline(self, limit=None):
+        """Stage events of the leading incidents, each incident's in the order they happened"""
+        return [event for incident in self.incidents(limit) for event in incident['timeline']]
+    
+    def drain(self):
+        """Incidents opened or advanced since the last drain"""
+        changed = [incident.to_dict() for incident in self.changed.values()]
+        self.changed = {}
+        return changed
+    
+    def __len__(self):
+        return sum(len(incidents) for incidents in self.by_stage)
@@ -0,0 +1,60 @@
+"""
+Sliding Counters - Per-key event counts over a time window with bounded memory
+"""
+
+from collections import OrderedDict, deque
+
+# Most keys tracked per counter before the least recently seen are dropped
+MAX_TRACKED_KEYS = 100000
+
+# Each window is split into this many buckets; expiry happens a bucket at a time
+WINDOW_BUCKETS = 10
+
+
+class SlidingWindowCounter:
+    """Counts events per key within the last window_ms milliseconds of event time.
+    
+    Each key keeps at most WINDOW_BUCKETS + 1 bucket counts, however many
+    events it sees, and keys are evicted least recently used first once
+    max_keys are tracked.
+    """
+    
+    def __init__(self, window_ms, max_keys=MAX_TRACKED_KEYS, buckets=WINDOW_BUCKETS):
+        self.window_ms = window_ms
+        self.bucket_ms = max(1, window_ms // buckets)
+        self.buckets = buckets
+        self.max_keys = max_keys
+        # key -> [total, deque of [bucket, count]]
+        self.keys = OrderedDict()
+    
+    def add(self, key, timestamp_ms):
+        """Record one event for key and return the key's count within the window"""
+        bucket = timestamp_ms // self.bucket_ms
+        entry = self.keys.get(key)
+        if entry is None:
+            entry = self.keys[key] = [0, deque()]
+            if len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+        else:
+            self.keys.move_to_end(key)
+        
+        history = entry[1]
+        if history and bucket <= history[-1][0]:
+            # Same bucket, or a late event, which counts toward the newest bucket
+            history[-1][1] += 1
+        else:
+            history.append([bucket, 1])
+        entry[0] += 1
+        
+        # Drop buckets that have slid out of the window
+        oldest = history[-1][0] - self.buckets
+        while history[0][0] <= oldest:
+            entry[0] -= history.popleft()[1]
+        
+        return entry[0]
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def clear(self):
+        self.keys.clear()
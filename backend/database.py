@@ -1,86 +1,686 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import threading
+import calendar
+import ipaddress
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from parser import timestamp_to_ms
+from log_record import LogRecord
+
+# Applied to every connection. WAL lets readers run alongside the writer, and
+# with it synchronous=NORMAL only syncs at checkpoints; a power cut can lose
+# the last commits but never corrupts the database.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',  # KiB, so 64 MiB
+    'PRAGMA temp_store = MEMORY'
+)
+
+# Seconds a connection waits for another writer before giving up
+BUSY_TIMEOUT = 30
+
+# Rows fetched per step when streaming a whole table out
+EXPORT_BATCH_SIZE = 1000
+
+# Log ids looked up per query when alerts are joined to their logs
+MAX_QUERY_IDS = 500
+
+# Logs are partitioned by UTC day of their timestamp, or of when they were stored if they have none
+DAY_MS = 86400 * 1000
+
+# A log id is its partition's day shifted left by this many bits, plus a sequence number within the day
+PARTITION_ID_BITS = 32
+
+# Last partition day whose ids still fit in a JavaScript number (2 ** 53)
+MAX_PARTITION_DAY = 2 ** (53 - PARTITION_ID_BITS) - 1
+
+# Low-cardinality log fields are stored as ids into these lookup tables
+LOOKUP_TABLES = {
+    'source': 'sources',
+    'severity': 'severities',
+    'log_type': 'log_types',
+    'username': 'usernames'
+}
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS severities (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS log_types (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS usernames (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    
+    -- Alerts keep what detection adds; the rest is read from the log they link to.
+    -- Each row aggregates count repeats of its rule and key, from its log's time to last_seen_ms.
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_id INTEGER,
+        type TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        description TEXT,
+        timestamp_ms INTEGER,
+        rule_version TEXT,
+        count INTEGER NOT NULL DEFAULT 1,
+        last_seen_ms INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_alerts_timestamp_ms ON alerts (timestamp_ms);
+    CREATE INDEX IF NOT EXISTS idx_alerts_log_id ON alerts (log_id);
+    CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts (type);
+    CREATE INDEX IF NOT EXISTS idx_alerts_severity ON alerts (severity);
+'''
+
+# One table of logs per day, named log_entries_YYYYMMDD.
+# ip_address holds IPv4 as INTEGER, IPv6 as a 16-byte BLOB and anything else as TEXT.
+# Each index also orders by time (and rowid), so filtered pages are read newest first straight off it.
+PARTITION_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        timestamp_ms INTEGER,
+        source_id INTEGER REFERENCES sources (id),
+        severity_id INTEGER REFERENCES severities (id),
+        message TEXT,
+        raw_log TEXT,
+        log_type_id INTEGER REFERENCES log_types (id),
+        ip_address,
+        username_id INTEGER REFERENCES usernames (id),
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS {table}_timestamp_ms ON {table} (timestamp_ms)',
+    'CREATE INDEX IF NOT EXISTS {table}_severity ON {table} (severity_id, timestamp_ms)',
+    'CREATE INDEX IF NOT EXISTS {table}_log_type ON {table} (log_type_id, timestamp_ms)',
+    'CREATE INDEX IF NOT EXISTS {table}_ip_address ON {table} (ip_address, timestamp_ms)'
+)
+
+INSERT_LOG = '''
+    INSERT INTO {table} (id, timestamp, timestamp_ms, source_id, severity_id, message, raw_log,
+                         log_type_id, ip_address, username_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+'''
+
+# Decoded columns in LogRecord.COLUMNS order from one partition, aliased e for filters
+LOG_SELECT = '''
+    SELECT e.id, e.timestamp, e.timestamp_ms, src.name, sev.name, e.message, e.raw_log,
+           lt.name, e.ip_address, u.name, e.created_at
+    FROM {table} e
+    LEFT JOIN sources src ON src.id = e.source_id
+    LEFT JOIN severities sev ON sev.id = e.severity_id
+    LEFT JOIN log_types lt ON lt.id = e.log_type_id
+    LEFT JOIN usernames u ON u.id = e.username_id
+'''
+
+ALERT_COLUMNS = '''
+    id, type, severity, description, timestamp_ms, log_id, rule_version, count, COALESCE(last_seen_ms, timestamp_ms)
+'''
+
+# What alerts read from their logs, for the ids given, from one partition
+ALERT_LOG_SELECT = '''
+    SELECT e.id, e.timestamp, src.name, e.ip_address, u.name, COALESCE(e.message, e.raw_log)
+    FROM {table} e
+    LEFT JOIN sources src ON src.id = e.source_id
+    LEFT JOIN usernames u ON u.id = e.username_id
+    WHERE e.id IN ({ids})
+'''
+
+def partition_day(timestamp_ms):
+    """Partition day of a log timestamp, or of now for None; out-of-range days go to the first or last partition"""
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    return min(max(timestamp_ms // DAY_MS, 0), MAX_PARTITION_DAY)
+
+def partition_table(day):
+    return f"log_entries_{datetime.fromtimestamp(day * 86400, timezone.utc):%Y%m%d}"
+
+def table_day(table):
+    """Inverse of partition_table"""
+    return calendar.timegm(datetime.strptime(table[-8:], '%Y%m%d').timetuple()) // 86400
+
+def id_day(log_id):
+    """Partition day of a log id"""
+    return log_id >> PARTITION_ID_BITS
+
+@lru_cache(maxsize=65536)
+def encode_ip(ip_address):
+    """Pack an IP for storage; text that wouldn't round-trip is kept as is"""
+    if not ip_address:
+        return None
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return ip_address
+    if str(address) != ip_address:
+        return ip_address
+    return int(address) if address.version == 4 else address.packed
+
+@lru_cache(maxsize=65536)
+def decode_ip(stored):
+    """Inverse of encode_ip"""
+    if stored is None:
+        return ''
+    if isinstance(stored, int):
+        return str(ipaddress.IPv4Address(stored))
+    if isinstance(stored, bytes):
+        return str(ipaddress.IPv6Address(stored))
+    return stored
+
+def decode_record(row):
+    """LogRecord from a row selected as LOG_SELECT"""
+    return LogRecord.from_row(row[:8] + (decode_ip(row[8]),) + row[9:])
+
+def decode_alert(row, log=None):
+    """Alert dict from an alerts row selected as ALERT_COLUMNS and its log's ALERT_LOG_SELECT row, if still stored"""
+    id, type, severity, description, timestamp_ms, log_id, rule_version, count, last_seen_ms = row
+    _, timestamp, source, ip_address, username, details = log or (None,) * 6
+    return {
+        'id': id,
+        'type': type,
+        'severity': severity,
+        'description': description,
+        'timestamp': timestamp,
+        'timestamp_ms': timestamp_ms,
+        'source': source or '',
+        'ip_address': decode_ip(ip_address),
+        'username': username or '',
+        'details': details or '',
+        'log_id': log_id,
+        'rule_version': rule_version,
+        'count': count,
+        'last_seen_ms': last_seen_ms
+    }
 
 class Database:
+    """Logs in one table per day, queried partition by partition; alerts in a single table"""
+    
     def __init__(self, db_path='../database/logwatch.db'):
         self.db_path = db_path
+        # value -> id for each lookup table; ids never change once assigned
+        self.lookup_ids = {column: {} for column in LOOKUP_TABLES}
+        # (schema_version, partition days oldest first), replaced whole so threads never see a mix
+        self.partitions = (None, [])
+        # Each thread keeps its own connection open
+        self.local = threading.local()
         self.init_db()
     
+    def connect(self):
+        """This thread's connection, opened on first use and reused until close"""
+        conn = getattr(self.local, 'conn', None)
+        # A forked worker must not share its parent's connection
+        if conn is None or self.local.pid != os.getpid():
+            conn = self.local.conn = self.new_connection()
+            self.local.pid = os.getpid()
+        return conn
+    
+    def new_connection(self):
+        """A connection of the caller's own, set up like the shared ones"""
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def close(self):
+        """Close this thread's connection; the next call opens a new one"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+    
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                source TEXT,
-                severity TEXT,
-                message TEXT,
-                raw_log TEXT,
-                log_type TEXT,
-                ip_address TEXT,
-                username TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        def table_exists(name):
+            return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+        
+        # Databases from before dictionary encoding have logs as a plain table.
+        # The rename commits on its own, so a logs_legacy left behind is a migration that never finished.
+        if table_exists('logs'):
+            cursor.execute('ALTER TABLE logs RENAME TO logs_legacy')
+        legacy = table_exists('logs_legacy')
+        # and those from before partitioning keep every log in one table, read through a logs view
+        unpartitioned = table_exists('log_entries')
+        cursor.execute('DROP VIEW IF EXISTS logs')
+        
+        # Logs stored before alerts were persisted have to be rescanned once
+        had_alerts = table_exists('alerts')
+        
+        cursor.executescript(SCHEMA)
+        
+        # Alerts tables from before rule versions were stamped, and before aggregation
+        alert_columns = [row[1] for row in cursor.execute('PRAGMA table_info(alerts)')]
+        if 'rule_version' not in alert_columns:
+            cursor.execute('ALTER TABLE alerts ADD COLUMN rule_version TEXT')
+        if 'count' not in alert_columns:
+            cursor.execute('ALTER TABLE alerts ADD COLUMN count INTEGER NOT NULL DEFAULT 1')
+            cursor.execute('ALTER TABLE alerts ADD COLUMN last_seen_ms INTEGER')
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        if legacy:
+            self.migrate_legacy_logs(conn)
+        if unpartitioned:
+            self.migrate_unpartitioned_logs(conn)
+        # Migrated logs get new ids, so their alerts are rebuilt too
+        if legacy or unpartitioned:
+            cursor.execute('DELETE FROM alerts')
+        self.needs_rescan = bool(legacy or unpartitioned) or not had_alerts and self.count_logs() > 0
         
         conn.commit()
-        conn.close()
     
-    def insert_logs(self, logs):
-        conn = sqlite3.connect(self.db_path)
+    def migrate_legacy_logs(self, conn, batch_size=10000):
+        """Copy rows from the old flat logs table into the encoded schema"""
         cursor = conn.cursor()
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(logs_legacy)')]
+        timestamp_ms = 'timestamp_ms' if 'timestamp_ms' in columns else 'NULL'
         
-        for log in logs:
-            cursor.execute('''
-                INSERT INTO logs (timestamp, source, severity, message, raw_log, log_type, ip_address, username)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                log.get('timestamp', ''),
-                log.get('source', ''),
-                log.get('severity', 'INFO'),
-                log.get('message', ''),
-                log.get('raw_log', ''),
-                log.get('log_type', 'unknown'),
-                log.get('ip_address', ''),
-                log.get('username', '')
-            ))
+        rows = conn.execute(f'''
+            SELECT NULL, timestamp, {timestamp_ms}, source, severity, message, raw_log,
+                   log_type, ip_address, username, created_at
+            FROM logs_legacy ORDER BY id
+        ''')
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            
+            records = []
+            for row in batch:
+                record = LogRecord.from_row(row)
+                if record.timestamp_ms is None:
+                    record.timestamp_ms = timestamp_to_ms(record.timestamp or '')
+                if record.timestamp_ms is None and record.created_at:
+                    created = datetime.strptime(record.created_at, '%Y-%m-%d %H:%M:%S')
+                    record.timestamp_ms = calendar.timegm(created.timetuple()) * 1000
+                records.append(record)
+            self.write_logs(cursor, records)
         
-        conn.commit()
-        conn.close()
+        cursor.execute('DROP TABLE logs_legacy')
     
-    def get_all_logs(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+    def migrate_unpartitioned_logs(self, conn, batch_size=10000):
+        """Move rows from the single log_entries table into day partitions"""
         cursor = conn.cursor()
+        rows = conn.execute(LOG_SELECT.format(table='log_entries') + ' ORDER BY e.id')
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            
+            records = [decode_record(row) for row in batch]
+            for record in records:
+                record.id = None
+            self.write_logs(cursor, records)
+        
+        cursor.execute('DROP TABLE log_entries')
+    
+    def partition_days(self, conn):
+        """Days that have a log partition, oldest first"""
+        # Any process creating or dropping a partition bumps the schema version
+        version = conn.execute('PRAGMA schema_version').fetchone()[0]
+        cached_version, days = self.partitions
+        if version != cached_version:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'log_entries_[0-9]*'")
+            days = sorted(table_day(table) for table, in tables)
+            self.partitions = (version, days)
+        return days
+    
+    def days_between(self, conn, since=None, until=None):
+        """Partition days that can hold logs timed in [since, until), oldest first"""
+        first = partition_day(since) if since is not None else 0
+        last = partition_day(until - 1) if until is not None else MAX_PARTITION_DAY
+        return [day for day in self.partition_days(conn) if first <= day <= last]
+    
+    def lookup_id(self, cursor, column, value):
+        """Id of value in the lookup table for column, adding it if new"""
+        if not value:
+            return None
         
-        cursor.execute('SELECT * FROM logs ORDER BY timestamp DESC')
-        rows = cursor.fetchall()
+        ids = self.lookup_ids[column]
+        lookup_id = ids.get(value)
+        if lookup_id is None:
+            table = LOOKUP_TABLES[column]
+            cursor.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (value,))
+            lookup_id = cursor.execute(f'SELECT id FROM {table} WHERE name = ?', (value,)).fetchone()[0]
+            ids[value] = lookup_id
+        return lookup_id
+    
+    def find_id(self, cursor, column, value):
+        """Id of value in the lookup table for column, or None if it was never stored"""
+        ids = self.lookup_ids[column]
+        lookup_id = ids.get(value)
+        if lookup_id is None:
+            row = cursor.execute(f'SELECT id FROM {LOOKUP_TABLES[column]} WHERE name = ?', (value,)).fetchone()
+            if row is not None:
+                lookup_id = ids[value] = row[0]
+        return lookup_id
+    
+    def write_logs(self, cursor, logs):
+        """Insert records into their day partitions, giving each new one a globally unique id.
         
-        logs = [dict(row) for row in rows]
-        conn.close()
-        return logs
+        Must run inside a write transaction opened with BEGIN IMMEDIATE, so
+        no other writer can take the ids handed out here.
+        """
+        by_day = defaultdict(list)
+        for log in logs:
+            by_day[partition_day(log.timestamp_ms) if log.id is None else id_day(log.id)].append(log)
+        
+        lookup_id = self.lookup_id
+        days = set(self.partition_days(cursor.connection))
+        for day, day_logs in by_day.items():
+            table = partition_table(day)
+            if day not in days:
+                for statement in PARTITION_SCHEMA:
+                    cursor.execute(statement.format(table=table))
+            
+            # Ids continue from the partition's highest, and start at the day's first id
+            last_id = cursor.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0]
+            next_id = (day << PARTITION_ID_BITS if last_id is None else last_id) + 1
+            for log in day_logs:
+                if log.id is None:
+                    log.id = next_id
+                    next_id += 1
+            
+            cursor.executemany(INSERT_LOG.format(table=table), [(
+                log.id,
+                log.timestamp,
+                log.timestamp_ms,
+                lookup_id(cursor, 'source', log.source),
+                lookup_id(cursor, 'severity', log.severity),
+                log.stored_message,  # NULL when the message is just the raw line
+                log.raw_log,
+                lookup_id(cursor, 'log_type', log.log_type),
+                encode_ip(log.ip_address),
+                lookup_id(cursor, 'username', log.username),
+                log.created_at
+            ) for log in day_logs])
     
-    def get_logs(self, limit=100, severity=None):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def insert_logs(self, logs):
+        if not logs:
+            return
         
-        if severity:
-            cursor.execute('SELECT * FROM logs WHERE severity = ? ORDER BY timestamp DESC LIMIT ?', (severity, limit))
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self.write_logs(conn.cursor(), logs)
+        except Exception:
+            # Ids handed out in the rolled back transaction may be handed out again,
+            # and lookup values it added were never stored
+            for log in logs:
+                log.id = None
+            self.lookup_ids = {column: {} for column in LOOKUP_TABLES}
+            raise
+    
+    def get_all_logs(self):
+        """Every log, newest first, those without a timestamp last"""
+        logs = [log for batch in self.iter_logs() for log in batch]
+        logs.reverse()
+        return logs
+    
+    def scan_partition(self, conn, day, timed, batch_size):
+        """One partition's logs with or without a timestamp, oldest first, a query per batch"""
+        if timed:
+            keyset, order, position = '(e.timestamp_ms, e.id) > (?, ?)', 'e.timestamp_ms, e.id', (-2 ** 63, 0)
         else:
-            cursor.execute('SELECT * FROM logs ORDER BY timestamp DESC LIMIT ?', (limit,))
+            keyset, order, position = 'e.timestamp_ms IS NULL AND e.id > ?', 'e.id', (0,)
+        select = LOG_SELECT.format(table=partition_table(day))
+        while True:
+            rows = conn.execute(f'{select} WHERE {keyset} ORDER BY {order} LIMIT ?', (*position, batch_size)).fetchall()
+            if not rows:
+                break
+            position = (rows[-1][2], rows[-1][0]) if timed else (rows[-1][0],)
+            yield [decode_record(row) for row in rows]
+    
+    def iter_logs(self, batch_size=10000):
+        """All logs oldest first, in lists of up to batch_size records.
+        
+        Logs without a timestamp come first, then the rest partition by
+        partition. Each batch is a query of its own, so no read lock is held
+        while the caller writes between batches.
+        """
+        conn = self.connect()
+        days = list(self.partition_days(conn))
+        for timed in (False, True):
+            for day in days:
+                yield from self.scan_partition(conn, day, timed, batch_size)
+    
+    def partition_bounds(self):
+        """{day: (lowest id, highest id)} of every partition holding logs"""
+        conn = self.connect()
+        bounds = {}
+        for day in self.partition_days(conn):
+            first_id, last_id = conn.execute(f'SELECT MIN(id), MAX(id) FROM {partition_table(day)}').fetchone()
+            if first_id is not None:
+                bounds[day] = (first_id, last_id)
+        return bounds
+    
+    def get_logs_by_id(self, first_id, last_id):
+        """Logs with ids from first_id to last_id inclusive, in id order; the ids must share a partition"""
+        conn = self.connect()
+        if id_day(first_id) not in self.partition_days(conn):
+            return []
+        cursor = conn.execute(LOG_SELECT.format(table=partition_table(id_day(first_id))) +
+                              ' WHERE e.id BETWEEN ? AND ? ORDER BY e.id', (first_id, last_id))
+        return [decode_record(row) for row in cursor]
+    
+    def log_filters(self, conn, severity=None, since=None, until=None, ip_address=None, log_type=None):
+        """WHERE conditions on a partition aliased e and their params, or None when nothing can match"""
+        conditions = []
+        params = []
+        for column, value in (('severity', severity), ('log_type', log_type)):
+            if value:
+                lookup_id = self.find_id(conn, column, value)
+                if lookup_id is None:
+                    return None
+                conditions.append(f'e.{column}_id = ?')
+                params.append(lookup_id)
+        if ip_address:
+            conditions.append('e.ip_address = ?')
+            params.append(encode_ip(ip_address))
+        if since is not None:
+            conditions.append('e.timestamp_ms >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('e.timestamp_ms < ?')
+            params.append(until)
+        return conditions, params
+    
+    def count_logs(self, **filters):
+        """Number of logs, or of those matching get_logs filters"""
+        conn = self.connect()
+        found = self.log_filters(conn, **filters)
+        if found is None:
+            return 0
+        conditions, params = found
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return sum(conn.execute(f'SELECT COUNT(*) FROM {partition_table(day)} e {where}', params).fetchone()[0]
+                   for day in self.days_between(conn, filters.get('since'), filters.get('until')))
+    
+    def get_logs(self, limit=100, before=None, **filters):
+        """Newest logs first, optionally filtered by severity, IP, log type and an epoch-ms time range.
         
-        rows = cursor.fetchall()
-        logs = [dict(row) for row in rows]
-        conn.close()
+        before is the (timestamp_ms, id) of the last log of the previous
+        page; the page continues right after it. Logs without a timestamp
+        come last, newest id first. Partitions are read newest first until
+        the page is full, each one a range read off an index, so deep pages
+        cost the same as the first.
+        """
+        conn = self.connect()
+        found = self.log_filters(conn, **filters)
+        if found is None:
+            return []
+        conditions, params = found
+        since, until = filters.get('since'), filters.get('until')
+        
+        # Logs with a timestamp, then those without; before tells which part the last page ended in
+        pages = []
+        if before is None:
+            pages.append((['e.timestamp_ms IS NOT NULL'], [], 'e.timestamp_ms DESC, e.id DESC'))
+        elif before[0] is not None:
+            pages.append((['(e.timestamp_ms, e.id) < (?, ?)'], list(before), 'e.timestamp_ms DESC, e.id DESC'))
+        if since is None and until is None:
+            if before is None or before[0] is not None:
+                pages.append((['e.timestamp_ms IS NULL'], [], 'e.id DESC'))
+            else:
+                pages.append((['e.timestamp_ms IS NULL', 'e.id < ?'], [before[1]], 'e.id DESC'))
+        
+        logs = []
+        days = self.days_between(conn, since, until)
+        for keyset, keyset_params, order in pages:
+            for day in reversed(days):
+                if len(logs) >= limit:
+                    return logs
+                cursor = conn.execute(f'''
+                    {LOG_SELECT.format(table=partition_table(day))}
+                    WHERE {' AND '.join(conditions + keyset)} ORDER BY {order} LIMIT ?
+                ''', (*params, *keyset_params, limit - len(logs)))
+                logs.extend(decode_record(row) for row in cursor)
         return logs
     
+    def stream_logs(self, batch_size=EXPORT_BATCH_SIZE, **filters):
+        """Logs matching get_logs filters in lists of up to batch_size records, partition by partition, oldest first.
+        
+        Unlike iter_logs this reads one snapshot on a connection of its own,
+        a single query per partition, however slowly the rows are taken;
+        the connection is closed when the generator is.
+        """
+        conn = self.new_connection()
+        try:
+            conn.execute('BEGIN')
+            found = self.log_filters(conn, **filters)
+            if found is None:
+                return
+            conditions, params = found
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            for day in self.days_between(conn, filters.get('since'), filters.get('until')):
+                cursor = conn.execute(f'''
+                    {LOG_SELECT.format(table=partition_table(day))}
+                    {where} ORDER BY e.timestamp_ms, e.id
+                ''', params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [decode_record(row) for row in rows]
+        finally:
+            conn.close()
+    
+    def decode_alerts(self, conn, rows):
+        """Alert dicts for ALERT_COLUMNS rows, with the fields read from their logs, a query per partition"""
+        log_ids = defaultdict(list)
+        for row in rows:
+            if row[5] is not None:
+                log_ids[id_day(row[5])].append(row[5])
+        
+        logs = {}
+        days = set(self.partition_days(conn))
+        for day, ids in log_ids.items():
+            # A partition dropped since the alerts were read; expire_logs deletes its alerts too
+            if day not in days:
+                continue
+            for start in range(0, len(ids), MAX_QUERY_IDS):
+                chunk = ids[start:start + MAX_QUERY_IDS]
+                query = ALERT_LOG_SELECT.format(table=partition_table(day), ids=', '.join('?' * len(chunk)))
+                logs.update((log[0], log) for log in conn.execute(query, chunk))
+        return [decode_alert(row, logs.get(row[5])) for row in rows]
+    
+    def stream_alerts(self, batch_size=EXPORT_BATCH_SIZE, severity=None, type=None, since=None, until=None):
+        """Alerts oldest first, optionally filtered, in lists of up to batch_size; read like stream_logs"""
+        conditions = []
+        params = []
+        for column, value in (('severity = ?', severity), ('type = ?', type),
+                              ('timestamp_ms >= ?', since), ('timestamp_ms < ?', until)):
+            if value is not None:
+                conditions.append(column)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        conn = self.new_connection()
+        try:
+            conn.execute('BEGIN')
+            cursor = conn.execute(f'SELECT {ALERT_COLUMNS} FROM alerts {where} ORDER BY timestamp_ms, id', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield self.decode_alerts(conn, rows)
+        finally:
+            conn.close()
+    
+    def insert_alerts(self, alerts):
+        """Store alerts, replacing each one's id with its stable stored id"""
+        if not alerts:
+            return
+        
+        conn = self.connect()
+        with conn:
+            conn.executemany('''
+                INSERT INTO alerts (log_id, type, severity, description, timestamp_ms, rule_version, count, last_seen_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(alert['log_id'], alert['type'], alert['severity'], alert['description'], alert['timestamp_ms'],
+                   alert.get('rule_version'), alert.get('count', 1), alert.get('last_seen_ms')) for alert in alerts])
+            # The write lock is held throughout, so the ids are consecutive
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        for offset, alert in enumerate(alerts, last_id - len(alerts) + 1):
+            alert['id'] = offset
+    
+    def update_alerts(self, alerts):
+        """Write back the count, last seen time and description of stored aggregate alerts"""
+        if not alerts:
+            return
+        
+        conn = self.connect()
+        with conn:
+            conn.executemany('UPDATE alerts SET count = ?, last_seen_ms = ?, description = ? WHERE id = ?',
+                             [(alert['count'], alert['last_seen_ms'], alert['description'], alert['id']) for alert in alerts])
+    
+    def get_alerts(self, limit=None, oldest_first=False):
+        """Stored alerts, newest first unless oldest_first"""
+        conn = self.connect()
+        order = 'ASC' if oldest_first else 'DESC'
+        rows = conn.execute(f'''
+            SELECT {ALERT_COLUMNS} FROM alerts
+            ORDER BY timestamp_ms {order}, id {order}
+            LIMIT ?
+        ''', (-1 if limit is None else limit,)).fetchall()
+        return self.decode_alerts(conn, rows)
+    
+    def alert_counts(self):
+        """Stored alert counts as (by_severity, by_type) dicts"""
+        conn = self.connect()
+        by_severity = dict(conn.execute('SELECT severity, COUNT(*) FROM alerts GROUP BY severity'))
+        by_type = dict(conn.execute('SELECT type, COUNT(*) FROM alerts GROUP BY type'))
+        return by_severity, by_type
+    
+    def expire_logs(self, retention_days, now_ms=None):
+        """Drop the partitions of days before the last retention_days, and the alerts on their logs.
+        
+        A partition goes as one DROP TABLE, however many rows it holds; its
+        pages are reused by later inserts. Returns the days dropped.
+        """
+        oldest_kept = partition_day(now_ms) - retention_days + 1
+        conn = self.connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = [day for day in self.partition_days(conn) if day < oldest_kept]
+            for day in expired:
+                # Alerts of a day are found by the id range of its logs
+                conn.execute('DELETE FROM alerts WHERE log_id BETWEEN ? AND ?',
+                             (day << PARTITION_ID_BITS, ((day + 1) << PARTITION_ID_BITS) - 1))
+                conn.execute(f'DROP TABLE {partition_table(day)}')
+        return expired
+    
+    def clear_alerts(self):
+        conn = self.connect()
+        with conn:
+            conn.execute('DELETE FROM alerts')
+    
     def clear_all(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM logs')
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        conn = self.connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM alerts')
+            for day in self.partition_days(conn):
+                conn.execute(f'DROP TABLE {partition_table(day)}')
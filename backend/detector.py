@@ -1,111 +1,283 @@
 import re
+import os
 import json
+import hashlib
+import threading
+import time
 from collections import Counter, defaultdict
 from datetime import datetime
+from counters import SlidingWindowCounter
+from aggregator import AlertAggregator, SUPPRESSION_WINDOW
+from correlator import KillChainCorrelator, ATTACK_STAGES
+from sketches import AlertSketches
+from keywords import KeywordMatcher, pattern_keywords
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Seconds a threshold rule counts matches over, unless the rule sets 'window'
+DEFAULT_WINDOW = 60
+
+# Per-rule profiling counters, in the order they are kept
+RULE_STATS = ('candidates', 'evaluations', 'matches', 'match_ns', 'alerts')
+
+# Rule files (.json, and .yaml/.yml when PyYAML is installed), merged in filename order
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+RULE_EXTENSIONS = ('.json', '.yaml', '.yml')
+
+def load_rule_files(rules_dir=RULES_DIR):
+    """Rules by name from every rule file in rules_dir; later files override earlier ones"""
+    rules = {}
+    for filename in sorted(os.listdir(rules_dir)):
+        if not filename.endswith(RULE_EXTENSIONS):
+            continue
+        
+        with open(os.path.join(rules_dir, filename)) as f:
+            if filename.endswith('.json'):
+                document = json.load(f)
+            elif yaml is not None:
+                document = yaml.safe_load(f)
+            else:
+                print(f" Skipping {filename}: PyYAML is not installed")
+                continue
+        
+        for rule in (document or {}).get('rules', []):
+            rule = dict(rule)
+            rules[rule.pop('name')] = rule
+    
+    return rules
+
+def check_rules(rules):
+    """Raise ValueError for the first rule missing a required field or with a field of the wrong type"""
+    for rule_name, rule in rules.items():
+        for field in ('pattern', 'severity', 'description'):
+            if not isinstance(rule.get(field), str):
+                raise ValueError(f"Rule {rule_name}: '{field}' must be a string")
+        if not isinstance(rule.get('threshold', 1), int) or isinstance(rule.get('threshold'), bool):
+            raise ValueError(f"Rule {rule_name}: 'threshold' must be an integer")
+        for field in ('window', 'suppress'):
+            value = rule.get(field, 0)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"Rule {rule_name}: '{field}' must be a non-negative number of seconds")
+        if not isinstance(rule.get('key', ''), str):
+            raise ValueError(f"Rule {rule_name}: 'key' must be a string")
+
+def rules_version(rules):
+    """Short digest identifying a rule set by its content"""
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:12]
+
+class RuleSet:
+    """Rules compiled for matching. Replaced whole on reload, never edited in place."""
+    
+    def __init__(self, rules):
+        # A bad rule fails here, so a reload keeps the rules in force
+        check_rules(rules)
+        self.rules = rules
+        self.version = rules_version(rules)
+        self.compile_rules()
+    
+    def compile_rules(self):
+        """Compile rule patterns into one keyword matcher plus per-rule confirmation"""
+        self.patterns = {}
+        # keyword -> [(rule_name, confirmed)]: confirmed when the keyword alone is a match
+        self.keyword_rules = defaultdict(list)
+        # Rules with no keyword to gate on run on every line
+        unguarded = []
+        
+        for rule_name, rule in self.rules.items():
+            self.patterns[rule_name] = re.compile(rule['pattern'], re.IGNORECASE)
+            exact, required = pattern_keywords(rule['pattern'])
+            for keyword in exact:
+                self.keyword_rules[keyword].append((rule_name, True))
+            if required is None:
+                unguarded.append(rule_name)
+                continue
+            for keyword in required:
+                self.keyword_rules[keyword].append((rule_name, False))
+        
+        self.order = {rule_name: index for index, rule_name in enumerate(self.rules)}
+        self.every_rule = [(rule_name, False) for rule_name in self.rules]
+        self.unguarded = [(rule_name, False) for rule_name in unguarded]
+        # One search rules out every unguarded rule on lines none of them match.
+        # Patterns with groups stay out, since merging would renumber backreferences.
+        combinable = [self.patterns[rule_name] for rule_name in unguarded if not self.patterns[rule_name].groups]
+        self.unguarded_re = re.compile('|'.join(f'(?:{pattern.pattern})' for pattern in combinable),
+                                       re.IGNORECASE) if len(combinable) == len(unguarded) and unguarded else None
+        
+        # Also covers the severity keywords, so the parser can share it
+        self.keywords = KeywordMatcher(self.keyword_rules)
+        self.candidates = {}
+    
+    def rule_candidates(self, hits):
+        """Rules a line with these keywords could match, in rule order, each with whether the keywords confirm it"""
+        candidates = self.candidates.get(hits)
+        if candidates is None:
+            found = {}
+            for keyword in hits:
+                for rule_name, confirmed in self.keyword_rules.get(keyword, ()):
+                    found[rule_name] = found.get(rule_name, False) or confirmed
+            candidates = sorted(found.items(), key=lambda candidate: self.order[candidate[0]])
+            if len(self.candidates) >= KeywordMatcher.CACHE_SIZE:
+                self.candidates.clear()
+            self.candidates[hits] = candidates
+        return candidates
+    
+    def match(self, log, rule_stats):
+        """Names of the rules a record matches, in rule order, counted into rule_stats"""
+        message = log.message
+        if message.isascii():
+            # Reuse the parser's scan when it shared this matcher
+            hits = log.keywords
+            if log.stored_message is not None or not self.keywords.owns(hits):
+                hits = self.keywords.scan(message.lower())
+            candidates = self.rule_candidates(hits)
+            if self.unguarded and (self.unguarded_re is None or self.unguarded_re.search(message)):
+                candidates = sorted(candidates + self.unguarded, key=lambda candidate: self.order[candidate[0]])
+        else:
+            # IGNORECASE folds some non-ASCII letters that lower() leaves alone
+            candidates = self.every_rule
+        
+        matched = []
+        for rule_name, confirmed in candidates:
+            stats = rule_stats[rule_name]
+            stats[0] += 1
+            if not confirmed:
+                start = time.perf_counter_ns()
+                found = self.patterns[rule_name].search(message)
+                stats[3] += time.perf_counter_ns() - start
+                stats[1] += 1
+                if not found:
+                    continue
+            stats[2] += 1
+            matched.append(rule_name)
+        
+        return matched
+    
+    def new_counters(self, previous=None):
+        """Sliding window counters for the rules that only alert past a threshold.
+        
+        Counters in previous are carried over for rules whose window is unchanged.
+        """
+        counters = {}
+        for rule_name, rule in self.rules.items():
+            if rule.get('threshold', 1) <= 1:
+                continue
+            window_ms = rule.get('window', DEFAULT_WINDOW) * 1000
+            counter = (previous or {}).get(rule_name)
+            counters[rule_name] = counter if counter is not None and counter.window_ms == window_ms else \
+                SlidingWindowCounter(window_ms)
+        return counters
 
 class ThreatDetector:
-    def __init__(self):
-        self.rules = self.load_rules()
+    def __init__(self, rules=None, rules_dir=RULES_DIR):
+        self.rules_dir = rules_dir
+        self.ruleset = RuleSet(self.load_rules() if rules is None else rules)
+        self.reset_rule_stats()
+    
+    @property
+    def rules(self):
+        return self.ruleset.rules
+    
+    @property
+    def keywords(self):
+        """Keyword matcher of the current rules, to share with the parser"""
+        return self.ruleset.keywords
     
     def load_rules(self):
         """Load detection rules"""
+        return load_rule_files(self.rules_dir)
+    
+    def reload(self):
+        """Compile the rule files and swap them in; returns whether the rules changed.
+        
+        Compilation runs on the calling thread while detection carries on with
+        the old rules, and the swap is a single assignment.
+        """
+        ruleset = RuleSet(self.load_rules())
+        if ruleset.version == self.ruleset.version:
+            return False
+        self.ruleset = ruleset
+        return True
+    
+    def reset_rule_stats(self):
+        """Start the per-rule profiling counters over"""
+        self.lines_checked = 0
+        # rule name -> counts in RULE_STATS order; kept by name across reloads
+        self.rule_stats = defaultdict(lambda: [0] * len(RULE_STATS))
+        self.stats_since = datetime.now().isoformat()
+    
+    def get_rule_stats(self):
+        """Per-rule profiling counters since the last reset, most expensive rules first.
+        
+        candidates counts lines the keyword prefilter let through, evaluations
+        the full pattern searches among them (lines a keyword alone confirms
+        skip the search), and match_ns the time those searches took.
+        """
+        rules = {}
+        for rule_name, counts in sorted(self.rule_stats.items(), key=lambda item: -item[1][3]):
+            stats = dict(zip(RULE_STATS, counts))
+            stats['match_ms'] = round(stats.pop('match_ns') / 1e6, 3)
+            stats['us_per_evaluation'] = round(stats['match_ms'] * 1000 / stats['evaluations'], 3) if stats['evaluations'] else None
+            stats['active'] = rule_name in self.rules
+            rules[rule_name] = stats
+        
         return {
-            'brute_force': {
-                'pattern': r'Failed password|authentication failure|invalid user',
-                'threshold': 5,
-                'severity': 'HIGH',
-                'description': 'Multiple failed login attempts detected'
-            },
-            'privilege_escalation': {
-                'pattern': r'sudo|su root|elevated privileges|runas',
-                'threshold': 1,
-                'severity': 'CRITICAL',
-                'description': 'Privilege escalation attempt detected'
-            },
-            'file_deletion': {
-                'pattern': r'rm -rf|del /f|remove-item|deleted|file removed',
-                'threshold': 1,
-                'severity': 'MEDIUM',
-                'description': 'Suspicious file deletion detected'
-            },
-            'port_scan': {
-                'pattern': r'SYN.*multiple|port scan|scanning detected',
-                'threshold': 1,
-                'severity': 'HIGH',
-                'description': 'Port scanning activity detected'
-            },
-            'suspicious_network': {
-                'pattern': r'connection refused|connection timeout|dropped',
-                'threshold': 10,
-                'severity': 'MEDIUM',
-                'description': 'Suspicious network activity'
-            },
-            'malware_indicator': {
-                'pattern': r'malware|virus|trojan|ransomware|cryptolocker',
-                'threshold': 1,
-                'severity': 'CRITICAL',
-                'description': 'Potential malware activity detected'
-            },
-            'data_exfiltration': {
-                'pattern': r'large file transfer|upload.*GB|exfiltration',
-                'threshold': 1,
-                'severity': 'CRITICAL',
-                'description': 'Possible data exfiltration'
-            },
-            'after_hours_access': {
-                'pattern': r'0[0-5]:\d{2}:\d{2}|login.*2[2-3]:\d{2}',
-                'threshold': 1,
-                'severity': 'MEDIUM',
-                'description': 'Access during unusual hours'
-            }
+            'since': self.stats_since,
+            'lines_checked': self.lines_checked,
+            'rule_version': self.ruleset.version,
+            'rules': rules
         }
     
-    def detect(self, logs):
-        """Run threat detection on logs"""
+    def detect(self, logs, stream=None):
+        """Run threat detection on logs, continuing a StreamingDetector's windows when given one.
+        
+        Returns one alert per rule match; a StreamingDetector folds repeats into aggregates.
+        """
+        # One rule set for the whole call, even if a reload swaps in another meanwhile
+        ruleset = self.ruleset
         alerts = []
-        ip_attempts = defaultdict(list)
-        user_attempts = defaultdict(list)
+        if stream is None:
+            counters = ruleset.new_counters()
+        else:
+            if stream.version != ruleset.version:
+                stream.counters = ruleset.new_counters(stream.counters)
+                stream.version = ruleset.version
+            counters = stream.counters
+        rule_stats = self.rule_stats
         
         for log in logs:
-            message = log.get('message', '')
+            self.lines_checked += 1
+            message = log.message
             
-            # Check each rule
-            for rule_name, rule in self.rules.items():
-                if re.search(rule['pattern'], message, re.IGNORECASE):
-                    # Track by IP and username for brute force detection
-                    if rule_name == 'brute_force':
-                        ip = log.get('ip_address', 'unknown')
-                        user = log.get('username', 'unknown')
-                        ip_attempts[ip].append(log)
-                        user_attempts[user].append(log)
-                        
-                        # Only alert if threshold exceeded
-                        if len(ip_attempts[ip]) >= rule['threshold']:
-                            alerts.append({
-                                'id': len(alerts) + 1,
-                                'type': rule_name,
-                                'severity': rule['severity'],
-                                'description': f"{rule['description']} - {len(ip_attempts[ip])} attempts from {ip}",
-                                'timestamp': log.get('timestamp'),
-                                'source': log.get('source'),
-                                'ip_address': ip,
-                                'username': user,
-                                'details': message,
-                                'log_id': log.get('id')
-                            })
-                    else:
-                        alerts.append({
-                            'id': len(alerts) + 1,
-                            'type': rule_name,
-                            'severity': rule['severity'],
-                            'description': rule['description'],
-                            'timestamp': log.get('timestamp'),
-                            'source': log.get('source'),
-                            'ip_address': log.get('ip_address', ''),
-                            'username': log.get('username', ''),
-                            'details': message,
-                            'log_id': log.get('id')
-                        })
+            for rule_name in ruleset.match(log, rule_stats):
+                rule = ruleset.rules[rule_name]
+                description = rule['description']
+                counter = counters.get(rule_name)
+                if counter is not None:
+                    # Only alert once enough matches from one key fall inside the window
+                    key = log.get(rule.get('key', 'ip_address'), '')
+                    attempts = counter.add(key, log.timestamp_ms or 0)
+                    if attempts < rule['threshold']:
+                        continue
+                    description = f"{description} - {attempts} attempts from {key}"
+                
+                alerts.append({
+                    'id': len(alerts) + 1,
+                    'type': rule_name,
+                    'severity': rule['severity'],
+                    'description': description,
+                    'timestamp': log.timestamp,
+                    'timestamp_ms': log.timestamp_ms,
+                    'source': log.source,
+                    'ip_address': log.ip_address,
+                    'username': log.username,
+                    'details': message,
+                    'log_id': log.id,
+                    'rule_version': ruleset.version
+                })
+                rule_stats[rule_name][4] += 1
         
         return alerts
     
@@ -114,8 +286,12 @@ class ThreatDetector:
         severity_count = Counter([a['severity'] for a in alerts])
         type_count = Counter([a['type'] for a in alerts])
         
+        return self.summarize(severity_count, type_count)
+    
+    def summarize(self, severity_count, type_count):
+        """Statistics from alert counts by severity and by type"""
         return {
-            'total_alerts': len(alerts),
+            'total_alerts': sum(severity_count.values()),
             'by_severity': dict(severity_count),
             'by_type': dict(type_count),
             'critical_count': severity_count.get('CRITICAL', 0),
@@ -128,23 +304,14 @@ class ThreatDetector:
         if not alerts:
             return []
         
-        # Sort by timestamp
-        sorted_alerts = sorted(alerts, key=lambda x: x.get('timestamp', ''))
+        # Sort by epoch timestamp
+        sorted_alerts = sorted(alerts, key=lambda x: x.get('timestamp_ms') or 0)
         
         timeline = []
         
-        # Create narrative
-        attack_stages = {
-            'port_scan': ' Reconnaissance: Attacker scanned the network for vulnerabilities',
-            'brute_force': ' Initial Access: Attempted to breach account security',
-            'privilege_escalation': ' Privilege Escalation: Gained elevated system access',
-            'file_deletion': ' Impact: Attempted to delete critical files',
-            'data_exfiltration': 'Exfiltration: Attempted to steal data',
-            'malware_indicator': ' Malware: Malicious software detected'
-        }
-        
         for alert in sorted_alerts[:10]:  # Top 10 for timeline
-            stage = attack_stages.get(alert['type'], f" {alert['type'].replace('_', ' ').title()}")
+            stage = ATTACK_STAGES[alert['type']][1] if alert['type'] in ATTACK_STAGES else \
+                f" {alert['type'].replace('_', ' ').title()}"
             timeline.append({
                 'time': alert.get('timestamp'),
                 'stage': stage,
@@ -153,4 +320,95 @@ class ThreatDetector:
                 'details': alert.get('details', '')[:100]
             })
         
-        return timeline
\ No newline at end of file
+        return timeline
+
+class StreamingDetector:
+    """Long-lived detection over a stream of new records.
+    
+    Each record is examined once. Threshold windows, open alert aggregates,
+    incidents and alert totals carry across batches, so the cost of a batch
+    does not depend on how many logs came before it.
+    """
+    
+    def __init__(self, detector):
+        self.detector = detector
+        # Monitor events, uploads and rescans arrive on different threads. Callers
+        # may hold it around storing a batch too, so it is reentrant.
+        self.lock = threading.RLock()
+        self.reset()
+    
+    def reset(self):
+        """Forget all state, e.g. after the logs table is cleared"""
+        self.version = self.detector.ruleset.version
+        self.counters = self.detector.ruleset.new_counters()
+        self.aggregator = AlertAggregator()
+        self.correlator = KillChainCorrelator()
+        # Origins of every alert, repeats included
+        self.sketches = AlertSketches()
+        self.by_type = Counter()
+        self.by_severity = Counter()
+    
+    def take_over(self, other):
+        """Carry on from another StreamingDetector's state, e.g. one that rescanned the stored logs"""
+        with self.lock:
+            self.version = other.version
+            self.counters = other.counters
+            self.aggregator = other.aggregator
+            self.correlator = other.correlator
+            self.sketches = other.sketches
+            self.by_type = other.by_type
+            self.by_severity = other.by_severity
+    
+    def restore(self, alerts):
+        """Pick up totals and incidents from stored alerts, oldest first, e.g. after a restart"""
+        with self.lock:
+            self.correlator.clear()
+            self.sketches.clear()
+            self.by_type = Counter()
+            self.by_severity = Counter()
+            for alert in alerts:
+                self.correlator.add(alert)
+                # Repeats are counted at the aggregate's first timestamp
+                self.sketches.add(alert, alert.get('count', 1))
+                self.by_type[alert['type']] += 1
+                self.by_severity[alert['severity']] += 1
+            self.correlator.drain()
+    
+    def process(self, logs):
+        """Detect threats in new records, oldest first, and fold them into the running totals.
+        
+        Returns (alerts, updates, escalations) as aggregate does.
+        """
+        with self.lock:
+            alerts = self.detector.detect(logs, self)
+            rules = self.detector.rules
+            keys = [alert.get(rules.get(alert['type'], {}).get('key', 'ip_address'), '') for alert in alerts]
+            return self.aggregate(alerts, keys)
+    
+    def aggregate(self, alerts, keys):
+        """Fold alerts, in detection order, into one alert per rule and key within the rule's suppression window.
+        
+        Returns (alerts, updates, escalations): the new aggregates to store,
+        stored aggregates whose count changed, and those among the updates
+        whose count reached the next power of ten.
+        """
+        with self.lock:
+            rules = self.detector.rules
+            new_alerts = []
+            for alert, key in zip(alerts, keys):
+                self.sketches.add(alert)
+                window_ms = rules.get(alert['type'], {}).get('suppress', SUPPRESSION_WINDOW) * 1000
+                if self.aggregator.add(alert, key, window_ms) is None:
+                    continue
+                self.by_type[alert['type']] += 1
+                self.by_severity[alert['severity']] += 1
+                self.correlator.add(alert)
+                new_alerts.append(alert)
+            
+            updates, escalations = self.aggregator.drain()
+        return new_alerts, updates, escalations
+    
+    def drain_incidents(self):
+        """Incidents opened or advanced since the last call"""
+        with self.lock:
+            return self.correlator.drain()
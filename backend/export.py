@@ -0,0 +1,47 @@
+"""
+Export - Encodes streamed logs and alerts as NDJSON or CSV, optionally gzipped
+"""
+
+import csv
+import io
+import json
+import zlib
+
+# Export format -> content type
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# CSV columns, in order
+LOG_FIELDS = ('id', 'timestamp', 'timestamp_ms', 'source', 'severity', 'log_type', 'ip_address', 'username',
+              'message', 'raw_log', 'created_at')
+ALERT_FIELDS = ('id', 'type', 'severity', 'description', 'timestamp', 'timestamp_ms', 'last_seen_ms', 'count',
+                'source', 'ip_address', 'username', 'details', 'log_id', 'rule_version')
+
+
+def encode_rows(batches, fields, export_format):
+    """One text chunk per batch of dicts: NDJSON lines, or CSV rows after a header chunk"""
+    if export_format != 'csv':
+        for batch in batches:
+            yield ''.join(json.dumps(row) + '\n' for row in batch)
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    # The header goes out before the first query returns
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row.get(field) for field in fields] for row in batch)
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress text chunks into one gzip stream, flushed after each chunk so readers can decode as it arrives"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
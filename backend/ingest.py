@@ -0,0 +1,126 @@
+"""
+Bulk Ingest - Parses large log files across a process pool and stores them in file order
+"""
+
+import argparse
+import os
+from collections import deque
+from itertools import islice
+from multiprocessing import get_all_start_methods, get_context
+
+from database import Database
+from detector import ThreatDetector, StreamingDetector
+from parser import LogParser
+from rescan import rescan_alerts
+
+# Each worker task covers roughly this many bytes of input
+RANGE_SIZE = 8 * 1024 * 1024
+
+# Lines read from the head of a file to pin its format
+SNIFF_LINES = 20
+
+# Workers start from a clean server process, not forked from a caller that may be running threads.
+# They import the caller's main module afresh, so its startup work has to sit under __main__, as in app.py.
+POOL_CONTEXT = get_context('forkserver' if 'forkserver' in get_all_start_methods() else 'spawn')
+
+_parser = None
+
+
+def split_ranges(filepath, range_size=RANGE_SIZE):
+    """Split a file into (start, end) byte ranges that begin and end on line boundaries"""
+    size = os.path.getsize(filepath)
+    ranges = []
+    
+    with open(filepath, 'rb') as f:
+        start = 0
+        while start < size:
+            end = start + range_size
+            if end >= size:
+                end = size
+            else:
+                # Extend the range to the end of the line it lands in
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            
+            ranges.append((start, end))
+            start = end
+    
+    return ranges
+
+
+def parse_range(filepath, start, end, filename='', log_type=None):
+    """Worker: parse one byte range of a file into a LogBatch"""
+    global _parser
+    if _parser is None:
+        _parser = LogParser()
+    
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    return _parser.parse_buffer(data.decode('utf-8', errors='ignore'), filename, log_type)
+
+
+def bulk_ingest(filepath, db, workers=None, filename=None, range_size=RANGE_SIZE, store=None):
+    """Parse a file in parallel and insert the records in their original order.
+    
+    store, if given, is called with each batch of records in place of
+    db.insert_logs, e.g. to run detection on them as well.
+    """
+    store = store or db.insert_logs
+    filename = filename or os.path.basename(filepath)
+    workers = workers or os.cpu_count() or 1
+    ranges = iter(split_ranges(filepath, range_size))
+    count = 0
+    
+    # Pin the format once for the whole file, as the monitor does for its sources
+    with open(filepath, encoding='utf-8', errors='ignore') as f:
+        log_type = LogParser().sniff_format(list(islice(f, SNIFF_LINES)), filename)
+    
+    with POOL_CONTEXT.Pool(workers) as pool:
+        # Keep a bounded window of ranges in flight so memory stays flat
+        pending = deque()
+        
+        def submit():
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.apply_async(parse_range, (filepath, *next_range, filename, log_type)))
+        
+        for _ in range(workers * 2):
+            submit()
+        
+        while pending:
+            logs = pending.popleft().get().records()
+            submit()
+            store(logs)
+            count += len(logs)
+    
+    return count
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Bulk ingest log files into the LogWatch database')
+    arg_parser.add_argument('files', nargs='+', help='log files to ingest, in order')
+    arg_parser.add_argument('-j', '--parallel', type=int, default=os.cpu_count(), help='number of parser processes')
+    arg_parser.add_argument('--db', default='../database/logwatch.db', help='database path')
+    args = arg_parser.parse_args()
+    
+    db = Database(args.db)
+    # Detect as the server does, carrying on from the alerts already stored
+    stream = StreamingDetector(ThreatDetector())
+    if db.needs_rescan:
+        rescan_alerts(db, stream)
+    else:
+        stream.restore(db.get_alerts(oldest_first=True))
+    
+    def store(logs):
+        with stream.lock:
+            db.insert_logs(logs)
+            alerts, updates, _ = stream.process(logs)
+            db.insert_alerts(alerts)
+            db.update_alerts(updates)
+    
+    for path in args.files:
+        count = bulk_ingest(path, db, workers=args.parallel, store=store)
+        print(f" Ingested {count} logs from {path}")
\ No newline at end of file
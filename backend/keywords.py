@@ -0,0 +1,154 @@
+"""
+Keyword Matcher - One scan of a line for every keyword the parser and detector care about
+"""
+
+import re
+
+# Severity keywords in precedence order, matched case-insensitively anywhere in the line
+SEVERITY_KEYWORDS = (
+    ('CRITICAL', ('critical', 'fatal', 'emergency')),
+    ('ERROR', ('err', 'failed', 'failure')),
+    ('WARNING', ('warn',))
+)
+
+REGEX_SPECIAL = set('\\.^$*+?{}[]()|')
+
+
+class KeywordHits(frozenset):
+    """Keywords found in one line. Instances are interned by the matcher that produced them."""
+    
+    __slots__ = ()
+
+
+def split_alternatives(pattern):
+    """Split a pattern on its top-level | alternations"""
+    alternatives = []
+    depth = 0
+    start = 0
+    escaped = False
+    
+    for index, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(pattern[start:index])
+            start = index + 1
+    
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def is_literal(text):
+    return bool(text) and not REGEX_SPECIAL.intersection(text)
+
+
+def pattern_keywords(pattern):
+    """Keywords that decide or gate a case-insensitive pattern.
+    
+    Returns (exact, required). A line contains an exact keyword exactly when
+    that alternative matches. Each other alternative contributes the longest
+    literal it needs, so the pattern can only match if one of those is present.
+    required is None when some alternative has no literal to gate on.
+    """
+    exact = []
+    required = []
+    
+    for alternative in split_alternatives(pattern):
+        if is_literal(alternative):
+            exact.append(alternative.lower())
+            continue
+        
+        parts = [part for part in alternative.split('.*') if is_literal(part)]
+        if not parts:
+            return exact, None
+        required.append(max(parts, key=len).lower())
+    
+    return exact, required
+
+
+def trie_pattern(keywords):
+    """Regex for a set of literals, factored into a trie so its cost hardly grows with their number.
+    
+    Branches at each node start with distinct characters and extensions are
+    greedy, so at any position it matches the longest keyword there.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+    
+    return build(trie) if keywords else '(?!)'
+
+
+class KeywordMatcher:
+    """Finds every keyword in a line with a single regex pass over the line"""
+    
+    # Distinct keyword combinations kept before the caches start over
+    CACHE_SIZE = 4096
+    
+    def __init__(self, keywords=()):
+        keywords = {keyword for _, group in SEVERITY_KEYWORDS for keyword in group} | set(keywords)
+        self.keywords = tuple(sorted(keywords))
+        self.pattern = re.compile(trie_pattern(self.keywords))
+        
+        # The scan skips past each match, so it reports the keywords inside a
+        # match through contained, and re-checks the offsets where a keyword
+        # could start inside a match and run past its end.
+        prefixes = {keyword[:end] for keyword in self.keywords for end in range(1, len(keyword))}
+        self.contained = {
+            keyword: tuple(other for other in self.keywords if other in keyword) for keyword in self.keywords
+        }
+        self.overlaps = {
+            keyword: tuple(offset for offset in range(1, len(keyword)) if keyword[offset:] in prefixes)
+            for keyword in self.keywords
+        }
+        self.interned = {}
+        self.severities = {}
+    
+    def scan(self, line_lower):
+        """Keywords present in an already lowercased line"""
+        found = set()
+        for match in self.pattern.finditer(line_lower):
+            keyword = match.group()
+            found.update(self.contained[keyword])
+            for offset in self.overlaps[keyword]:
+                overlapping = self.pattern.match(line_lower, match.start() + offset)
+                if overlapping:
+                    found.update(self.contained[overlapping.group()])
+        
+        found = KeywordHits(found)
+        # Lines share a handful of keyword combinations, so records share the objects
+        hits = self.interned.get(found)
+        if hits is None:
+            if len(self.interned) >= self.CACHE_SIZE:
+                self.interned.clear()
+                self.severities.clear()
+            hits = self.interned[found] = found
+        return hits
+    
+    def owns(self, hits):
+        """Whether hits came from this matcher, and so cover its whole vocabulary"""
+        return hits is not None and self.interned.get(hits) is hits
+    
+    def severity(self, hits):
+        """Severity level for the keywords found in a line"""
+        severity = self.severities.get(hits)
+        if severity is None:
+            severity = next((level for level, group in SEVERITY_KEYWORDS if hits.intersection(group)), 'INFO')
+            self.severities[hits] = severity
+        return severity
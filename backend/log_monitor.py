@@ -4,13 +4,20 @@ Log Monitor - Watches log files for changes and sends to backend
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from itertools import islice
 import time
 import os
 
+# Lines read from the head of a file to sniff its format
+SNIFF_LINES = 20
+
 class LogFileHandler(FileSystemEventHandler):
-    def __init__(self, callback):
+    def __init__(self, callback, formats=None, sniff=None):
         self.callback = callback
         self.last_positions = {}
+        self.formats = formats or {}
+        self.sniff = sniff
+        self.source_formats = {}
     
     def on_modified(self, event):
         if event.is_directory:
@@ -38,18 +45,88 @@ class LogFileHandler(FileSystemEventHandler):
             # Process new lines
             if new_lines:
                 filename = os.path.basename(filepath)
-                self.callback(new_lines, filename)
+                self.callback(new_lines, filename, self.get_format(filepath))
         
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
+    
+    def get_format(self, filepath):
+        """Format pinned for a file: configured by name, or sniffed once per path and inode"""
+        filename = os.path.basename(filepath)
+        if filename in self.formats:
+            return self.formats[filename]
+        if self.sniff is None:
+            return None
+        
+        key = (filepath, os.stat(filepath).st_ino)
+        if key not in self.source_formats:
+            with open(filepath, 'r') as f:
+                head = list(islice(f, SNIFF_LINES))
+            
+            log_format = self.sniff(head, filename)
+            if log_format is None:
+                # Nothing recognizable yet, try again on the next change
+                return None
+            self.source_formats[key] = log_format
+        
+        return self.source_formats[key]
+
+
+class RuleFileHandler(FileSystemEventHandler):
+    """Recompiles detection rules when a rule file changes"""
+    
+    def __init__(self, detector, on_reload=None, extensions=('.json', '.yaml', '.yml')):
+        self.detector = detector
+        self.on_reload = on_reload
+        self.extensions = extensions
+    
+    def on_change(self, event):
+        if event.is_directory:
+            return
+        
+        # Editors often save by renaming a temporary file over the original
+        paths = (event.src_path, getattr(event, 'dest_path', ''))
+        if not any(path.endswith(self.extensions) for path in paths):
+            return
+        
+        try:
+            changed = self.detector.reload()
+        except Exception as e:
+            # A half-written or invalid file; the current rules stay in force
+            print(f"Error reloading rules: {e}")
+            return
+        
+        if changed and self.on_reload:
+            self.on_reload(self.detector)
+    
+    # Only changes to the files; opening them, as reload does, raises events too
+    on_created = on_modified = on_moved = on_deleted = on_change
+
+
+class RuleMonitor:
+    """Watches the rules directory on its own observer thread, so reloads never run on the ingest thread"""
+    
+    def __init__(self, rules_dir, detector, on_reload=None):
+        self.rules_dir = rules_dir
+        self.observer = Observer()
+        self.handler = RuleFileHandler(detector, on_reload)
+    
+    def start(self):
+        """Start watching the rules directory"""
+        self.observer.schedule(self.handler, self.rules_dir, recursive=False)
+        self.observer.start()
+    
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
 
 
 class LogMonitor:
-    def __init__(self, log_dir, callback):
+    def __init__(self, log_dir, callback, formats=None, sniff=None):
         self.log_dir = log_dir
         self.callback = callback
         self.observer = Observer()
-        self.handler = LogFileHandler(callback)
+        self.handler = LogFileHandler(callback, formats, sniff)
     
     def start(self):
         """Start monitoring log directory"""
@@ -64,8 +141,8 @@ class LogMonitor:
 
 
 if __name__ == '__main__':
-    def print_callback(lines, filename):
-        print(f"\n[{filename}] New lines: {len(lines)}")
+    def print_callback(lines, filename, log_format):
+        print(f"\n[{filename}] ({log_format or 'unknown'}) New lines: {len(lines)}")
         for line in lines:
             print(f"  {line.strip()}")
     
@@ -0,0 +1,155 @@
+"""
+Log Record - Compact representation of one parsed log line
+"""
+
+import sys
+
+
+class LogRecord:
+    """A parsed log line. message is only stored when it differs from raw_log.
+    
+    keywords holds the KeywordHits found when the line was parsed, or None.
+    """
+    
+    __slots__ = ('id', 'raw_log', 'timestamp', 'timestamp_ms', 'source', 'severity',
+                 'log_type', 'ip_address', 'username', 'created_at', '_message', 'keywords')
+    
+    # Column order used by the logs table and by from_row
+    COLUMNS = ('id', 'timestamp', 'timestamp_ms', 'source', 'severity', 'message',
+               'raw_log', 'log_type', 'ip_address', 'username', 'created_at')
+    
+    def __init__(self, raw_log, timestamp, timestamp_ms, source, severity, log_type,
+                 ip_address='', username='', message=None, id=None, created_at=None, keywords=None):
+        self.id = id
+        self.raw_log = raw_log
+        self.timestamp = timestamp
+        self.timestamp_ms = timestamp_ms
+        self.source = source
+        self.severity = severity
+        self.log_type = log_type
+        self.ip_address = ip_address
+        self.username = username
+        self.created_at = created_at
+        self._message = None if message == raw_log else message
+        self.keywords = keywords
+    
+    @property
+    def message(self):
+        return self.raw_log if self._message is None else self._message
+    
+    @property
+    def stored_message(self):
+        """Message to persist, None when it is just the raw line"""
+        return self._message
+    
+    @classmethod
+    def from_row(cls, row):
+        """Build a record from a logs row selected in COLUMNS order"""
+        (id, timestamp, timestamp_ms, source, severity, message,
+         raw_log, log_type, ip_address, username, created_at) = row
+        # Low-cardinality fields share one string object across records
+        return cls(raw_log, timestamp, timestamp_ms, sys.intern(source or ''), sys.intern(severity or ''),
+                   sys.intern(log_type or ''), sys.intern(ip_address or ''), sys.intern(username or ''),
+                   message, id, created_at)
+    
+    def get(self, key, default=None):
+        """dict-style access for code that still treats records as dicts"""
+        return getattr(self, key, default)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def to_dict(self):
+        """JSON-ready dict in the shape the API has always returned"""
+        log = {}
+        if self.id is not None:
+            log['id'] = self.id
+        log.update({
+            'raw_log': self.raw_log,
+            'timestamp': self.timestamp,
+            'timestamp_ms': self.timestamp_ms,
+            'source': self.source,
+            'severity': self.severity,
+            'message': self.message,
+            'log_type': self.log_type,
+            'ip_address': self.ip_address,
+            'username': self.username
+        })
+        if self.created_at is not None:
+            log['created_at'] = self.created_at
+        return log
+    
+    def __reduce__(self):
+        # Compact pickling for records returned from worker processes
+        return (LogRecord, (self.raw_log, self.timestamp, self.timestamp_ms, self.source, self.severity,
+                            self.log_type, self.ip_address, self.username, self._message, self.id,
+                            self.created_at))
+    
+    def __eq__(self, other):
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+    
+    def __repr__(self):
+        return f"LogRecord({self.to_dict()!r})"
+
+class LogBatch:
+    """Column-oriented batch of parsed lines, one list per field"""
+    
+    __slots__ = ('raw_log', 'timestamp', 'timestamp_ms', 'source', 'severity',
+                 'log_type', 'ip_address', 'username', 'keywords')
+    
+    # Columns that travel between processes; keyword hits are only meaningful locally
+    PICKLED = __slots__[:-1]
+    
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+    
+    @classmethod
+    def from_records(cls, records):
+        batch = cls()
+        for record in records:
+            batch.append(record)
+        return batch
+    
+    def append_values(self, raw_log, timestamp, timestamp_ms, source, severity, log_type, ip_address, username,
+                      keywords=None):
+        self.raw_log.append(raw_log)
+        self.timestamp.append(timestamp)
+        self.timestamp_ms.append(timestamp_ms)
+        self.source.append(source)
+        self.severity.append(severity)
+        self.log_type.append(log_type)
+        self.ip_address.append(ip_address)
+        self.username.append(username)
+        self.keywords.append(keywords)
+    
+    def append(self, record):
+        self.append_values(record.raw_log, record.timestamp, record.timestamp_ms, record.source,
+                           record.severity, record.log_type, record.ip_address, record.username,
+                           record.keywords)
+    
+    def __len__(self):
+        return len(self.raw_log)
+    
+    def __iter__(self):
+        for *values, keywords in zip(self.raw_log, self.timestamp, self.timestamp_ms, self.source,
+                                     self.severity, self.log_type, self.ip_address, self.username,
+                                     self.keywords):
+            yield LogRecord(*values, keywords=keywords)
+    
+    def records(self):
+        """The batch as a list of LogRecords"""
+        return list(self)
+    
+    def __getstate__(self):
+        return tuple(getattr(self, column) for column in self.PICKLED)
+    
+    def __setstate__(self, state):
+        for column, values in zip(self.PICKLED, state):
+            setattr(self, column, values)
+        self.keywords = [None] * len(self.raw_log)
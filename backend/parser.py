@@ -1,17 +1,113 @@
 import re
-from datetime import datetime
+import codecs
+import time
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import accumulate, count
+from operator import add
+from keywords import KeywordMatcher
+from log_record import LogRecord, LogBatch
+
+WINDOWS_TS = r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}'
+SYSLOG_TS = r'\w+\s+\d+\s+\d+:\d+:\d+'
+APACHE_TS = r'\d{2}/\w+/\d{4}:\d{2}:\d{2}:\d{2}'
+IP_ADDRESS = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+
+# One anchored pattern per format. A match yields timestamp and source (and the
+# client IP for apache) in a single pass; lines that don't fit fall back to the
+# generic field-by-field extractors.
+FORMAT_PATTERNS = {
+    'syslog': r'(?P<timestamp>(?P<source>[a-zA-Z]+)\s+\d+\s+\d+:\d+:\d+)\s',
+    'auth': r'(?P<timestamp>(?P<source>[a-zA-Z]+)\s+\d+\s+\d+:\d+:\d+)\s',
+    'apache': r'(?P<ip>(?P<source>\d{1,3})(?:\.\d{1,3}){3})\s+[^\s/:]+\s+[^\s/:]+\s+\[(?P<timestamp>' + APACHE_TS + r')',
+    'windows': r'(?P<timestamp>(?P<source>\d{4}-\d{2}-\d{2})\s+\d{2}:\d{2}:\d{2})\s'
+}
+
+# Timestamp formats that take precedence over the one a format pattern captured.
+# Each needs two colons of its own after the captured timestamp, so the guard
+# only runs when those are present.
+TIMESTAMP_GUARDS = {
+    'syslog': None,
+    'auth': WINDOWS_TS,
+    'apache': WINDOWS_TS + '|' + SYSLOG_TS,
+    'windows': None
+}
+
+LINE_TOKEN = re.compile(r'\[(?:\\.|[^\]\\])*\]|\\.')
+
+def within_line(pattern):
+    """Rewrite \\s so a pattern never matches across a newline in a multi-line buffer"""
+    def rewrite(token):
+        text = token.group()
+        if text == r'\s':
+            return r'[^\S\n]'
+        if text.startswith('[') and not text.startswith('[^') and r'\s' in text:
+            # [:\s] becomes (?:[:]|[^\S\n])
+            rest = text[1:-1].replace(r'\s', '')
+            return f'(?:[{rest}]|[^\\S\\n])' if rest else r'[^\S\n]'
+        return text
+    
+    return LINE_TOKEN.sub(rewrite, pattern)
+
+MONTHS = {name: number for number, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+@lru_cache(maxsize=4096)
+def timestamp_to_ms(timestamp):
+    """Convert an extracted timestamp to local epoch milliseconds, or None if unrecognized"""
+    # Timestamps have one-second resolution, so consecutive lines mostly hit the cache
+    try:
+        if '/' in timestamp:
+            # Apache: 15/Jan/2024:14:30:45
+            date, clock = timestamp.split(':', 1)
+            day, month, year = date.split('/')
+            parsed = datetime(int(year), MONTHS[month.title()], int(day), *map(int, clock.split(':')))
+        elif '-' in timestamp:
+            # Windows: 2024-01-15 14:30:45
+            date, clock = timestamp.split()
+            parsed = datetime(*map(int, date.split('-')), *map(int, clock.split(':')))
+        else:
+            # Syslog: Jan 15 14:30:45, with no year
+            month, day, clock = timestamp.split()
+            now = datetime.now()
+            parsed = datetime(now.year, MONTHS[month.title()], int(day), *map(int, clock.split(':')))
+            # A date well in the future was logged last year (e.g. December lines read in January)
+            if parsed - now > timedelta(days=1):
+                parsed = parsed.replace(year=now.year - 1)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+    
+    return int(parsed.timestamp() * 1000)
 
 class LogParser:
-    def __init__(self):
-        self.patterns = {
-            'syslog': r'(\w+\s+\d+\s+\d+:\d+:\d+)\s+(\S+)\s+(.+)',
-            'apache': r'(\S+)\s+\S+\s+\S+\s+\[([^\]]+)\]\s+"([^"]+)"\s+(\d+)',
-            'windows': r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\s+(\w+)\s+(.+)',
-            'auth': r'(\w+\s+\d+\s+\d+:\d+:\d+).*(Failed|Accepted|Invalid)\s+password\s+for\s+(\S+)\s+from\s+(\S+)'
-        }
-    
-    def parse(self, content, filename=''):
+    def __init__(self, keywords=None):
+        # Share the detector's matcher so one scan per line serves both
+        self.keywords = keywords or KeywordMatcher()
+        self.patterns = {name: re.compile(pattern) for name, pattern in FORMAT_PATTERNS.items()}
+        self.guards = {name: guard and re.compile(guard) for name, guard in TIMESTAMP_GUARDS.items()}
+        self.date_re = re.compile(r'\d{4}-\d{2}-\d{2}')
+        self.timestamp_res = [re.compile(WINDOWS_TS), re.compile(SYSLOG_TS), re.compile(APACHE_TS)]
+        self.source_re = re.compile(r'\b([a-zA-Z0-9\-]+)\b')
+        self.ip_re = re.compile(IP_ADDRESS)
+        self.username_res = [
+            re.compile(r'user[:\s]+(\S+)', re.IGNORECASE),
+            re.compile(r'for\s+(\S+)\s+from', re.IGNORECASE),
+            re.compile(r'login:\s+(\S+)', re.IGNORECASE)
+        ]
+        # Case-sensitive twins, run against the lowercased line when it is ASCII
+        self.username_lower_res = [re.compile(pattern.pattern) for pattern in self.username_res]
+        
+        # Whole-buffer username patterns for parse_buffer, confined to single lines
+        self.buffer_username_res = [re.compile(within_line(pattern.pattern), re.IGNORECASE) for pattern in self.username_res]
+        self.buffer_username_lower_res = [re.compile(within_line(pattern.pattern)) for pattern in self.username_res]
+    
+    def parse(self, content, filename='', log_type=None):
         """Parse logs from raw content"""
+        if log_type is not None:
+            return self.parse_buffer(content.strip(), filename, log_type).records()
+        
         logs = []
         lines = content.strip().split('\n')
         
@@ -19,87 +115,255 @@ class LogParser:
             if not line.strip():
                 continue
             
-            parsed = self.parse_line(line, filename)
+            parsed = self.parse_line(line, filename, log_type)
             if parsed:
                 logs.append(parsed)
         
         return logs
     
-    def parse_line(self, line, filename=''):
-        """Parse individual log line"""
-        log_entry = {
-            'raw_log': line,
-            'timestamp': self.extract_timestamp(line),
-            'source': self.extract_source(line, filename),
-            'severity': self.extract_severity(line),
-            'message': line,
-            'log_type': self.detect_log_type(line),
-            'ip_address': self.extract_ip(line),
-            'username': self.extract_username(line)
-        }
+    def parse_buffer(self, content, filename='', log_type=None):
+        """Parse a buffer of lines from one source into a column-oriented LogBatch.
+        
+        Username patterns run once over the whole lowercased buffer and their
+        hits are mapped back to lines. The rest of each line goes through the
+        anchored format pattern and cheap prefilters; on CPython, finditer over
+        the full buffer is slower than that for patterns without a literal
+        prefix, such as the format and IP patterns. Lines that don't fit the
+        format fall back to the generic extractors.
+        """
+        lines = content.split('\n')
+        if log_type is None:
+            return LogBatch.from_records(self.parse_line(line, filename) for line in lines if line.strip())
+        
+        # Lowercasing never adds or removes newlines, so lowered lines stay aligned
+        lowered = content.lower()
+        lower_lines = lowered.split('\n')
+        usernames = self.find_usernames(content, lowered, lines)
+        
+        pattern = self.patterns[log_type]
+        guard = self.guards[log_type]
+        extract_ip = self.extract_ip
+        scan = self.keywords.scan
+        severity = self.keywords.severity
+        batch = LogBatch()
+        
+        for index, line in enumerate(lines):
+            match = pattern.match(line)
+            if match is None or (guard is not None and line.count(':', match.end()) >= 2 and guard.search(line)):
+                if not line.strip():
+                    continue
+                record = self.parse_line_generic(line, filename, log_type)
+                timestamp, source, ip_address = record.timestamp, record.source, record.ip_address
+            else:
+                timestamp = match.group('timestamp')
+                source = match.group('source')
+                ip_address = match.group('ip') if log_type == 'apache' else extract_ip(line, match.end())
+            
+            hits = scan(lower_lines[index])
+            batch.raw_log.append(line)
+            batch.timestamp.append(timestamp)
+            batch.source.append(source)
+            batch.severity.append(severity(hits))
+            batch.ip_address.append(ip_address)
+            batch.username.append(usernames.get(index, ''))
+            batch.keywords.append(hits)
+        
+        batch.timestamp_ms = list(map(self.normalize_timestamp, batch.timestamp))
+        batch.log_type = [log_type] * len(batch)
+        return batch
+    
+    def find_usernames(self, content, lowered, lines):
+        """Username for each line that has one, by line index, from one pass per pattern"""
+        if content.isascii():
+            # ASCII lowercasing keeps offsets, so match the lowered buffer and slice the original
+            patterns, searched = self.buffer_username_lower_res, lowered
+        else:
+            patterns, searched = self.buffer_username_res, content
+        
+        # Offset of each line in content
+        starts = list(map(add, accumulate(map(len, lines), initial=0), count()))
+        
+        usernames = {}
+        # Lowest priority first, so higher-priority patterns overwrite it
+        for pattern in reversed(patterns):
+            found = {}
+            for match in pattern.finditer(searched):
+                found.setdefault(bisect_right(starts, match.start()) - 1, match)
+            for index, match in found.items():
+                usernames[index] = content[match.start(1):match.end(1)]
+        
+        return usernames
+    
+    def iter_parse(self, fileobj, filename='', batch_size=None, log_type=None, encoding='utf-8', chunk_size=1 << 16):
+        """Parse logs from a file object lazily, yielding records or lists of batch_size records"""
+        decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+        batch = []
+        pending = ''
+        
+        while True:
+            chunk = fileobj.read(chunk_size)
+            final = not chunk
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk, final=final)
+            
+            content = pending + chunk
+            if final:
+                pending = ''
+            else:
+                # The last piece may be a partial line until the input is exhausted
+                content, _, pending = content.rpartition('\n')
+            
+            if log_type is None:
+                records = (self.parse_line(line, filename) for line in content.split('\n') if line.strip())
+            else:
+                records = self.parse_buffer(content, filename, log_type)
+            
+            for parsed in records:
+                if batch_size is None:
+                    yield parsed
+                    continue
+                
+                batch.append(parsed)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            
+            if final:
+                break
+        
+        if batch:
+            yield batch
+    
+    def parse_line(self, line, filename='', log_type=None):
+        """Parse individual log line, as log_type when the source's format is known"""
+        if log_type is None:
+            log_type = self.detect_log_type(line)
+        
+        match = self.patterns[log_type].match(line)
+        if match is None:
+            return self.parse_line_generic(line, filename, log_type)
+        
+        guard = self.guards[log_type]
+        if guard is not None and line.count(':', match.end()) >= 2 and guard.search(line):
+            return self.parse_line_generic(line, filename, log_type)
+        
+        line_lower = line.lower()
+        ip_address = match.group('ip') if log_type == 'apache' else self.extract_ip(line, match.end())
+        timestamp = match.group('timestamp')
+        hits = self.keywords.scan(line_lower)
+        
+        return LogRecord(
+            line,
+            timestamp,
+            self.normalize_timestamp(timestamp),
+            match.group('source'),
+            self.keywords.severity(hits),
+            log_type,
+            ip_address,
+            self.extract_username(line, line_lower),
+            keywords=hits
+        )
+    
+    def parse_line_generic(self, line, filename='', log_type=None):
+        """Parse a line that fits no known format, one field at a time"""
+        timestamp = self.extract_timestamp(line)
+        hits = self.keywords.scan(line.lower())
+        log_entry = LogRecord(
+            raw_log=line,
+            timestamp=timestamp,
+            timestamp_ms=self.normalize_timestamp(timestamp),
+            source=self.extract_source(line, filename),
+            severity=self.keywords.severity(hits),
+            log_type=log_type or self.detect_log_type(line),
+            ip_address=self.extract_ip(line),
+            username=self.extract_username(line),
+            keywords=hits
+        )
         
         return log_entry
     
+    def sniff_format(self, lines, filename=''):
+        """Guess the format of a whole source from a sample of its lines"""
+        votes = Counter()
+        for line in lines:
+            line = line.rstrip('\r\n')
+            for log_type in ('apache', 'windows', 'syslog'):
+                if self.patterns[log_type].match(line):
+                    votes[log_type] += 1
+                    break
+        
+        if not votes:
+            return None
+        
+        log_type = votes.most_common(1)[0][0]
+        if log_type == 'syslog' and ('auth' in filename.lower() or
+                                     any(self.detect_log_type(line) == 'auth' for line in lines)):
+            return 'auth'
+        return log_type
+    
     def detect_log_type(self, line):
         """Detect log format type"""
         if 'Failed password' in line or 'Accepted password' in line:
             return 'auth'
-        elif re.search(r'GET|POST|PUT|DELETE', line):
+        elif 'GET' in line or 'POST' in line or 'PUT' in line or 'DELETE' in line:
             return 'apache'
-        elif re.search(r'\d{4}-\d{2}-\d{2}', line):
+        elif '-' in line and self.date_re.search(line):
             return 'windows'
         else:
             return 'syslog'
     
     def extract_timestamp(self, line):
         """Extract timestamp from log line"""
-        # Try different timestamp formats
-        patterns = [
-            r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}',  # Windows: 2024-01-15 14:30:45
-            r'\w+\s+\d+\s+\d+:\d+:\d+',                 # Syslog: Jan 15 14:30:45
-            r'\d{2}/\w+/\d{4}:\d{2}:\d{2}:\d{2}'       # Apache: 15/Jan/2024:14:30:45
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, line)
+        # Windows, then syslog, then apache formats
+        for pattern in self.timestamp_res:
+            match = pattern.search(line)
             if match:
                 return match.group(0)
         
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
+    def normalize_timestamp(self, timestamp):
+        """Epoch milliseconds for an extracted timestamp, falling back to now"""
+        timestamp_ms = timestamp_to_ms(timestamp)
+        return timestamp_ms if timestamp_ms is not None else int(time.time() * 1000)
+    
     def extract_source(self, line, filename):
         """Extract source/hostname"""
-        match = re.search(r'\b([a-zA-Z0-9\-]+)\b', line)
+        match = self.source_re.search(line)
         return match.group(1) if match else filename
     
-    def extract_severity(self, line):
+    def extract_severity(self, line, line_lower=None):
         """Extract severity level"""
-        line_lower = line.lower()
-        if any(word in line_lower for word in ['critical', 'fatal', 'emergency']):
-            return 'CRITICAL'
-        elif any(word in line_lower for word in ['error', 'err', 'failed', 'failure']):
-            return 'ERROR'
-        elif any(word in line_lower for word in ['warning', 'warn']):
-            return 'WARNING'
-        else:
-            return 'INFO'
+        if line_lower is None:
+            line_lower = line.lower()
+        return self.keywords.severity(self.keywords.scan(line_lower))
     
-    def extract_ip(self, line):
+    def extract_ip(self, line, pos=0):
         """Extract IP address"""
-        match = re.search(r'\b(?:\d{1,3}\.){3}\d{1,3}\b', line)
+        # A dotted quad needs at least three dots
+        if line.count('.', pos) < 3:
+            return ''
+        match = self.ip_re.search(line, pos)
         return match.group(0) if match else ''
     
-    def extract_username(self, line):
+    def extract_username(self, line, line_lower=None):
         """Extract username"""
-        patterns = [
-            r'user[:\s]+(\S+)',
-            r'for\s+(\S+)\s+from',
-            r'login:\s+(\S+)'
-        ]
+        if not line.isascii():
+            for pattern in self.username_res:
+                match = pattern.search(line)
+                if match:
+                    return match.group(1)
+            return ''
+        
+        # ASCII lowercasing keeps offsets, so match the lowered line and slice the original
+        if line_lower is None:
+            line_lower = line.lower()
+        if 'user' not in line_lower and 'for' not in line_lower and 'login:' not in line_lower:
+            return ''
         
-        for pattern in patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
+        for pattern in self.username_lower_res:
+            match = pattern.search(line_lower)
             if match:
-                return match.group(1)
+                return line[match.start(1):match.end(1)]
         
         return ''
\ No newline at end of file
@@ -14,8 +14,8 @@ class ReportGenerator:
         self.output_dir = '../database/reports'
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def generate_pdf(self, logs, alerts):
-        """Generate comprehensive PDF security report"""
+    def generate_pdf(self, total_logs, alerts, origins):
+        """Generate comprehensive PDF security report; origins is an AlertSketches summary"""
         filename = f"Sentinel_Security_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         filepath = os.path.join(self.output_dir, filename)
         
@@ -111,7 +111,7 @@ class ReportGenerator:
         summary_text = f"""
         This report presents a comprehensive security analysis conducted by Sentinel-LM, 
         an advanced real-time log monitoring and threat detection system. During the analysis period, 
-        the system processed <b>{len(logs):,}</b> log entries and identified <b>{len(alerts)}</b> security events 
+        the system processed <b>{total_logs:,}</b> log entries and identified <b>{len(alerts)}</b> security events 
         requiring attention.
         <br/><br/>
         <b>Overall Risk Assessment: <font color="{risk_color.hexval()}">{risk_level}</font></b> (Risk Score: {risk_score})
@@ -128,7 +128,7 @@ class ReportGenerator:
         
         findings_data = [
             ['Metric', 'Value', 'Status'],
-            ['Total Logs Analyzed', f'{len(logs):,}', 'Baseline'],
+            ['Total Logs Analyzed', f'{total_logs:,}', 'Baseline'],
             ['Security Events Detected', f'{len(alerts)}', 'Active Threats'],
             ['Critical Severity Alerts', f'{critical_count}', 'IMMEDIATE ACTION'],
             ['High Severity Alerts', f'{high_count}', 'URGENT'],
@@ -199,21 +199,21 @@ class ReportGenerator:
         # ==================== SOURCE ANALYSIS ====================
         story.append(Paragraph("<b>3.2 Attack Source Analysis</b>", styles['Heading3']))
         
-        sources = Counter([alert.get('source', 'Unknown') for alert in alerts])
-        ip_addresses = Counter([alert.get('ip_address', 'N/A') for alert in alerts if alert.get('ip_address')])
+        top_sources = origins['top']['source']
+        top_ips = origins['top']['ip_address']
         
         source_text = f"""
-        Analysis of attack origins reveals activity from <b>{len(sources)}</b> distinct log sources 
-        and <b>{len(ip_addresses)}</b> unique IP addresses. The primary attack vectors originate from 
-        {sources.most_common(1)[0][0] if sources else 'various sources'}.
+        Analysis of attack origins reveals activity from <b>{origins['unique']['source']}</b> distinct log sources 
+        and <b>{origins['unique']['ip_address']}</b> unique IP addresses. The primary attack vectors originate from 
+        {top_sources[0][0] if top_sources else 'various sources'}.
         """
         story.append(Paragraph(source_text, body_style))
         story.append(Spacer(1, 15))
         
         # Top IPs table
-        if ip_addresses:
+        if top_ips:
             ip_data = [['IP Address', 'Incident Count', 'Threat Level']]
-            for ip, count in ip_addresses.most_common(10):
+            for ip, count in top_ips[:10]:
                 if ip != 'N/A':
                     threat_level = 'CRITICAL' if count >= 5 else 'HIGH' if count >= 3 else 'MEDIUM'
                     ip_data.append([ip, str(count), threat_level])
@@ -254,6 +254,7 @@ class ReportGenerator:
                     ['Type', alert.get('type', 'Unknown').replace('_', ' ').title()],
                     ['Description', alert.get('description', 'N/A')],
                     ['Timestamp', alert.get('timestamp', 'N/A')],
+                    ['Occurrences', str(alert.get('count', 1))],
                     ['Source', alert.get('source', 'N/A')],
                     ['IP Address', alert.get('ip_address', 'N/A')],
                     ['Username', alert.get('username', 'N/A')],
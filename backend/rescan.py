@@ -0,0 +1,215 @@
+"""
+Rescan - Rebuilds the alerts table by re-running detection over every stored log
+"""
+
+import argparse
+import heapq
+import os
+import zlib
+from collections import defaultdict
+from itertools import islice
+from multiprocessing import get_all_start_methods, get_context
+
+from counters import SlidingWindowCounter
+from database import Database, id_day
+from detector import ThreatDetector, StreamingDetector, RuleSet, RULE_STATS, DEFAULT_WINDOW
+
+# Logs read from the database per detection batch
+RESCAN_BATCH_SIZE = 10000
+
+# Log ids per worker task in a parallel rescan; a task never spans partitions
+RANGE_SIZE = 50000
+
+# Alerts aggregated and stored per step when merging parallel results
+ALERT_BATCH_SIZE = 10000
+
+# Pools come from a fork server, or spawn, so no caller threads or locks are copied into workers
+POOL_CONTEXT = get_context('forkserver' if 'forkserver' in get_all_start_methods() else 'spawn')
+
+# Per-process state of parallel rescan workers
+_db = None
+_ruleset = None
+
+
+def rescan_alerts(db, stream, batch_size=RESCAN_BATCH_SIZE):
+    """Replace all stored alerts with a fresh pass over the logs, oldest first.
+    
+    The pass runs on a detector of its own, without the stream's lock, so
+    live batches carry on meanwhile. The lock is only taken at the end, to
+    swap the new alerts and state in and detect the logs stored during the
+    pass; their live alerts are replaced too.
+    """
+    rescanner = StreamingDetector(stream.detector)
+    bounds = db.partition_bounds()
+    alerts = []
+    for logs in db.iter_logs(batch_size):
+        # Logs stored after the pass began are left to catch_up
+        logs = [log for log in logs if log.id <= bounds.get(id_day(log.id), (0, 0))[1]]
+        # Aggregates are updated in place, so they are stored with their final counts
+        alerts.extend(rescanner.process(logs)[0])
+    
+    with stream.lock:
+        db.clear_alerts()
+        db.insert_alerts(alerts)
+        stream.take_over(rescanner)
+        return len(alerts) + catch_up(db, stream, bounds)
+
+
+def catch_up(db, stream, bounds):
+    """Detect and store the logs past bounds, as partition_bounds stood before a rescan; returns the alerts stored"""
+    count = 0
+    for day, (first_id, newest_id) in db.partition_bounds().items():
+        start = bounds[day][1] + 1 if day in bounds else first_id
+        while start <= newest_id:
+            alerts, updates, _ = stream.process(db.get_logs_by_id(start, start + RESCAN_BATCH_SIZE - 1))
+            db.insert_alerts(alerts)
+            db.update_alerts(updates)
+            count += len(alerts)
+            start += RESCAN_BATCH_SIZE
+    return count
+
+
+def worker_state(db_path, rules):
+    """This worker's database and compiled rules, kept between tasks"""
+    global _db, _ruleset
+    if _db is None or _db.db_path != db_path:
+        _db = Database(db_path)
+    if _ruleset is None or _ruleset.rules != rules:
+        _ruleset = RuleSet(rules)
+    return _db, _ruleset
+
+
+def alert_order(alert):
+    """Order a serial rescan stores alerts in: logs without a timestamp first, then time, log id and rule"""
+    timestamp_ms, log_id, rule_index = alert[:3]
+    return (timestamp_ms is not None, timestamp_ms or 0, log_id, rule_index)
+
+
+def analyze_range(task):
+    """Worker: match one id range of logs against the rules.
+    
+    Alerts of rules without a threshold are final and come back sorted by
+    alert_order. A threshold rule's alerts depend on every earlier match of
+    the same key, so its matches come back as (timestamp_ms, log_id, rule
+    index, key) to be counted per key afterwards. Alerts are aggregated
+    once they are merged back into order.
+    """
+    db_path, first_id, last_id, rules = task
+    db, ruleset = worker_state(db_path, rules)
+    rule_stats = defaultdict(lambda: [0] * len(RULE_STATS))
+    alerts = []
+    keyed = defaultdict(list)
+    
+    logs = db.get_logs_by_id(first_id, last_id)
+    for log in logs:
+        for rule_name in ruleset.match(log, rule_stats):
+            rule = ruleset.rules[rule_name]
+            key = log.get(rule.get('key', 'ip_address'), '')
+            if rule.get('threshold', 1) > 1:
+                keyed[rule_name].append((log.timestamp_ms, log.id, ruleset.order[rule_name], key))
+                continue
+            alerts.append((log.timestamp_ms, log.id, ruleset.order[rule_name], rule_name,
+                           rule['severity'], rule['description'], ruleset.version, key))
+            rule_stats[rule_name][4] += 1
+    
+    alerts.sort(key=alert_order)
+    return alerts, dict(keyed), dict(rule_stats), len(logs)
+
+
+def count_partition(task):
+    """Worker: replay one partition of a threshold rule's keys in time order and return its alerts"""
+    db_path, rule_name, matches, rules = task
+    _, ruleset = worker_state(db_path, rules)
+    rule = ruleset.rules[rule_name]
+    counter = SlidingWindowCounter(rule.get('window', DEFAULT_WINDOW) * 1000)
+    alerts = []
+    
+    # A partition holds every match of its keys, so counts equal a serial run's
+    for timestamp_ms, log_id, rule_index, key in sorted(matches, key=alert_order):
+        attempts = counter.add(key, timestamp_ms or 0)
+        if attempts >= rule['threshold']:
+            alerts.append((timestamp_ms, log_id, rule_index, rule_name, rule['severity'],
+                           f"{rule['description']} - {attempts} attempts from {key}", ruleset.version, key))
+    
+    return alerts
+
+
+def parallel_rescan(db, stream, workers=None, range_size=RANGE_SIZE):
+    """Rebuild all stored alerts across a process pool, with the same result as rescan_alerts.
+    
+    Workers read id ranges of partitions straight from the database. Matches of
+    threshold rules are then partitioned by key, so each key is counted in
+    time order by a single worker, and all alerts are merged back into the
+    order a serial rescan stores them. Live ingestion carries on meanwhile;
+    logs stored during the run are detected after the merge.
+    """
+    detector = stream.detector
+    ruleset = detector.ruleset
+    workers = workers or os.cpu_count() or 1
+    bounds = db.partition_bounds()
+    results = []
+    
+    if bounds:
+        with POOL_CONTEXT.Pool(workers) as pool:
+            tasks = [(db.db_path, start, min(start + range_size - 1, last_id), ruleset.rules)
+                     for first_id, last_id in bounds.values()
+                     for start in range(first_id, last_id + 1, range_size)]
+            keyed = defaultdict(list)
+            for alerts, matches, rule_stats, lines in pool.imap(analyze_range, tasks):
+                results.append(alerts)
+                for rule_name, found in matches.items():
+                    keyed[rule_name].extend(found)
+                for rule_name, counts in rule_stats.items():
+                    totals = detector.rule_stats[rule_name]
+                    for index, count in enumerate(counts):
+                        totals[index] += count
+                detector.lines_checked += lines
+            
+            for rule_name, found in keyed.items():
+                partitions = [[] for _ in range(workers)]
+                for match in found:
+                    partitions[zlib.crc32(str(match[3]).encode()) % workers].append(match)
+                tasks = [(db.db_path, rule_name, partition, ruleset.rules) for partition in partitions if partition]
+                for alerts in pool.imap_unordered(count_partition, tasks):
+                    results.append(alerts)
+                    detector.rule_stats[rule_name][4] += len(alerts)
+    
+    count = 0
+    with stream.lock:
+        stream.reset()
+        db.clear_alerts()
+        
+        merged = heapq.merge(*results, key=alert_order)
+        while True:
+            batch = list(islice(merged, ALERT_BATCH_SIZE))
+            if not batch:
+                break
+            alerts = [{'type': rule_name, 'severity': severity, 'description': description, 'timestamp_ms': timestamp_ms,
+                       'log_id': log_id, 'rule_version': version}
+                      for timestamp_ms, log_id, _, rule_name, severity, description, version, _ in batch]
+            alerts, updates, _ = stream.aggregate(alerts, [row[-1] for row in batch])
+            db.insert_alerts(alerts)
+            db.update_alerts(updates)
+            count += len(alerts)
+        # Merged alerts carry no IP or user, so incidents are rebuilt from the stored ones
+        stream.restore(db.get_alerts(oldest_first=True))
+        
+        # Logs stored while the workers ran; their live alerts were cleared above
+        count += catch_up(db, stream, bounds)
+    
+    return count
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Rebuild the LogWatch alerts table from stored logs')
+    arg_parser.add_argument('--db', default='../database/logwatch.db', help='database path')
+    arg_parser.add_argument('-j', '--parallel', type=int, default=1, help='number of detection processes')
+    args = arg_parser.parse_args()
+    
+    db = Database(args.db)
+    stream = StreamingDetector(ThreatDetector())
+    if args.parallel > 1:
+        count = parallel_rescan(db, stream, workers=args.parallel)
+    else:
+        count = rescan_alerts(db, stream)
+    print(f" Stored {count} alerts")
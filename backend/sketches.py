@@ -0,0 +1,190 @@
+"""
+Sketches - Fixed-memory alert counts, heavy hitters and distinct counts per IP, user and source
+"""
+
+import hashlib
+import math
+import operator
+from array import array
+
+# Alert fields sketched
+SKETCH_FIELDS = ('ip_address', 'username', 'source')
+
+# Alerts are sketched per bucket of this many seconds, and overall
+BUCKET_SECONDS = 3600
+
+# Buckets kept for time-range queries; the oldest go first
+MAX_BUCKETS = 168
+
+# Candidates each bucket keeps per field for its top values
+TOP_K = 64
+
+
+def hash64(field, value):
+    """Stable 64-bit hash of a field value, the same in every process"""
+    return int.from_bytes(hashlib.blake2b(f'{field}\0{value}'.encode(), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """Approximate counts per key that never undercount; overcounts are bounded by total / width"""
+    
+    def __init__(self, width=1024, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+    
+    def cells(self, hashed):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hashed & 0xffffffff
+        h2 = (hashed >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+    
+    def add(self, hashed, count=1):
+        """Count a key and return its new estimate"""
+        table = self.table
+        estimate = None
+        for cell in self.cells(hashed):
+            table[cell] += count
+            estimate = table[cell] if estimate is None else min(estimate, table[cell])
+        return estimate
+    
+    def estimate(self, hashed):
+        return min(self.table[cell] for cell in self.cells(hashed))
+    
+    def merge(self, other):
+        self.table = array('q', map(operator.add, self.table, other.table))
+
+
+class HyperLogLog:
+    """Approximate distinct count in 2**precision bytes, about 1.6% standard error at precision 12"""
+    
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+    
+    def add(self, hashed):
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are empty
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+    
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+class AlertSketch:
+    """Sketches of the alerts in one time bucket, or overall"""
+    
+    def __init__(self):
+        self.alerts = 0
+        self.counts = CountMinSketch()
+        self.distinct = {field: HyperLogLog() for field in SKETCH_FIELDS}
+        # field -> {value: estimated count} for the TOP_K heaviest values seen
+        self.top = {field: {} for field in SKETCH_FIELDS}
+        # Never above the lightest candidate's count, so most offers are turned away without a scan
+        self.floor = dict.fromkeys(SKETCH_FIELDS, 0)
+    
+    def add(self, hashes, count=1):
+        """Count one alert, given as [(field, value, hash64)] for its non-empty fields"""
+        self.alerts += count
+        for field, value, hashed in hashes:
+            self.distinct[field].add(hashed)
+            self.offer(field, value, self.counts.add(hashed, count))
+    
+    def offer(self, field, value, estimate):
+        """Keep value among the top candidates if it outweighs the lightest one"""
+        top = self.top[field]
+        if value in top or len(top) < TOP_K:
+            top[value] = estimate
+            return
+        if estimate <= self.floor[field]:
+            return
+        lightest = min(top, key=top.get)
+        self.floor[field] = top[lightest]
+        if estimate > top[lightest]:
+            del top[lightest]
+            top[value] = estimate
+    
+    def merge(self, other):
+        """Fold in another sketch, e.g. to cover several buckets"""
+        self.alerts += other.alerts
+        self.counts.merge(other.counts)
+        for field in SKETCH_FIELDS:
+            self.distinct[field].merge(other.distinct[field])
+            candidates = set(self.top[field]) | set(other.top[field])
+            self.top[field] = {}
+            self.floor[field] = 0
+            for value in candidates:
+                self.offer(field, value, self.counts.estimate(hash64(field, value)))
+    
+    def heaviest(self, field, limit):
+        """[value, estimated count] pairs for the heaviest values of field"""
+        # Candidates' estimates are refreshed, since other keys may have grown since each was offered
+        counts = [[value, self.counts.estimate(hash64(field, value))] for value in self.top[field]]
+        return sorted(counts, key=lambda item: -item[1])[:limit]
+    
+    def summary(self, limit=10):
+        return {
+            'alerts': self.alerts,
+            'unique': {field: self.distinct[field].count() for field in SKETCH_FIELDS},
+            'top': {field: self.heaviest(field, limit) for field in SKETCH_FIELDS}
+        }
+
+
+class AlertSketches:
+    """Alert origins sketched overall and per time bucket, in fixed memory.
+    
+    The overall sketch answers the common question at constant cost; a time
+    range merges the buckets it covers.
+    """
+    
+    def __init__(self, bucket_ms=BUCKET_SECONDS * 1000, max_buckets=MAX_BUCKETS):
+        self.bucket_ms = bucket_ms
+        self.max_buckets = max_buckets
+        self.clear()
+    
+    def clear(self):
+        self.total = AlertSketch()
+        # bucket start ms -> AlertSketch
+        self.buckets = {}
+    
+    def add(self, alert, count=1):
+        """Count an alert, or count repeats of it at once"""
+        hashes = [(field, alert.get(field), hash64(field, alert.get(field))) for field in SKETCH_FIELDS
+                  if alert.get(field)]
+        self.total.add(hashes, count)
+        
+        timestamp_ms = alert.get('timestamp_ms')
+        if timestamp_ms is None:
+            return
+        start = timestamp_ms - timestamp_ms % self.bucket_ms
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                oldest = min(self.buckets)
+                if start < oldest:
+                    return
+                del self.buckets[oldest]
+            bucket = self.buckets[start] = AlertSketch()
+        bucket.add(hashes, count)
+    
+    def summary(self, since=None, until=None, limit=10):
+        """Alert count, distinct and top values per field, overall or for buckets overlapping [since, until]"""
+        if since is None and until is None:
+            return self.total.summary(limit)
+        
+        merged = AlertSketch()
+        for start, bucket in self.buckets.items():
+            if (since is None or start + self.bucket_ms > since) and (until is None or start <= until):
+                merged.merge(bucket)
+        return merged.summary(limit)
@@ -0,0 +1,188 @@
+"""
+Batch Writer - Stores records from every producer on one thread, in group commits
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# A group is committed once it holds this many records...
+GROUP_COMMIT_ROWS = 5000
+
+# ...or once its oldest record has waited this many seconds
+GROUP_COMMIT_DELAY = 0.1
+
+# Records queued before producers have to wait
+MAX_QUEUED_ROWS = 50000
+
+
+class BatchWriter:
+    """Coalesces records from all producers into group commits on a single writer thread.
+    
+    Producers submit lists of records and carry on; the writer takes
+    whole submissions off a queue bounded in records and stores them
+    together once a group is full or its oldest record is due. Producers
+    block while the queue is full, or shed their records when a timeout
+    runs out. Each submission gets a Future that resolves to its record
+    count once stored, or to the commit's exception.
+    """
+    
+    def __init__(self, commit, on_commit=None, group_rows=GROUP_COMMIT_ROWS, group_delay=GROUP_COMMIT_DELAY,
+                 max_queued=MAX_QUEUED_ROWS):
+        # commit(records) stores a group and returns a result for on_commit(records, result)
+        self.commit = commit
+        self.on_commit = on_commit
+        self.group_rows = group_rows
+        self.group_delay = group_delay
+        self.max_queued = max_queued
+        # (records, future, monotonic time queued), oldest first
+        self.pending = deque()
+        self.queued = 0
+        # Producers waiting for room
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        self.reset_stats()
+    
+    def reset_stats(self):
+        with self.condition:
+            self.commits = 0
+            self.rows_committed = 0
+            self.rows_shed = 0
+            self.errors = 0
+            self.commit_seconds = 0.0
+            self.max_commit_seconds = 0.0
+            self.last_commit = None
+    
+    def start(self):
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(target=self.run, name='batch-writer', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """Commit whatever is queued, then end the writer thread"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+    
+    def submit(self, records, timeout=None):
+        """Queue records for the writer; returns their Future, or None if they were shed.
+        
+        Waits for room while the queue is full: forever when timeout is
+        None, else up to timeout seconds before shedding the records.
+        """
+        future = Future()
+        if not records:
+            future.set_result(0)
+            return future
+        
+        with self.condition:
+            # A submission larger than the queue is let in once the queue is empty
+            has_room = lambda: self.queued == 0 or self.queued + len(records) <= self.max_queued
+            if not has_room():
+                # Wakes the writer to commit without waiting for its deadline
+                self.waiting += 1
+                self.condition.notify_all()
+                fits = self.condition.wait_for(has_room, timeout)
+                self.waiting -= 1
+                if not fits:
+                    self.rows_shed += len(records)
+                    return None
+            self.pending.append((records, future, time.monotonic()))
+            self.queued += len(records)
+            self.condition.notify_all()
+        return future
+    
+    def run(self):
+        while True:
+            group = self.next_group()
+            if group is None:
+                return
+            self.write(group)
+    
+    def next_group(self):
+        """Wait for a full or due group and take it off the queue; None once stopped and drained"""
+        with self.condition:
+            while not self.pending:
+                if self.stopping:
+                    return None
+                self.condition.wait()
+            
+            # No point waiting out the deadline while producers wait for room
+            deadline = self.pending[0][2] + self.group_delay
+            while self.queued < self.group_rows and not self.waiting and not self.stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            
+            # Whole submissions only; one larger than a group is committed on its own
+            group = []
+            rows = 0
+            while self.pending and (not group or rows + len(self.pending[0][0]) <= self.group_rows):
+                submission = self.pending.popleft()
+                group.append(submission)
+                rows += len(submission[0])
+            self.queued -= rows
+            self.condition.notify_all()
+            return group
+    
+    def write(self, group):
+        records = group[0][0] if len(group) == 1 else [record for submission in group for record in submission[0]]
+        waited = time.monotonic() - group[0][2]
+        start = time.perf_counter()
+        try:
+            result = self.commit(records)
+        except Exception as e:
+            print(f"Error committing {len(records)} records: {e}")
+            with self.condition:
+                self.errors += 1
+            for _, future, _ in group:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+        
+        with self.condition:
+            self.commits += 1
+            self.rows_committed += len(records)
+            self.commit_seconds += elapsed
+            self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+            self.last_commit = {
+                'rows': len(records),
+                'submissions': len(group),
+                'commit_ms': round(elapsed * 1000, 3),
+                'wait_ms': round(waited * 1000, 3)
+            }
+        for submission, future, _ in group:
+            future.set_result(len(submission))
+        
+        if self.on_commit is not None:
+            try:
+                self.on_commit(records, result)
+            except Exception as e:
+                print(f"Error after committing {len(records)} records: {e}")
+    
+    def get_stats(self):
+        """Queue depth and commit counts and latency since the last reset"""
+        with self.condition:
+            return {
+                'queued_rows': self.queued,
+                'queued_submissions': len(self.pending),
+                'waiting_producers': self.waiting,
+                'max_queued_rows': self.max_queued,
+                'group_rows': self.group_rows,
+                'group_delay_ms': self.group_delay * 1000,
+                'commits': self.commits,
+                'rows_committed': self.rows_committed,
+                'rows_shed': self.rows_shed,
+                'errors': self.errors,
+                'avg_commit_ms': round(self.commit_seconds / self.commits * 1000, 3) if self.commits else None,
+                'max_commit_ms': round(self.max_commit_seconds * 1000, 3),
+                'last_commit': self.last_commit
+            }
@@ -72,6 +72,20 @@ function App() {
       }
     });
 
+    socket.on('alert_updates', (data) => {
+      console.log('Alert updates received:', data);
+      
+      const updated = Object.fromEntries(data.alerts.map(alert => [alert.id, alert]));
+      setAlerts(prev => prev.map(alert => updated[alert.id] ? { ...alert, ...updated[alert.id] } : alert));
+    });
+
+    socket.on('incidents', async (data) => {
+      console.log('Incidents advanced:', data.count);
+      
+      const timelineRes = await axios.get(`${API_URL}/timeline`);
+      setTimeline(timelineRes.data || []);
+    });
+
     socket.on('new_logs', (data) => {
       console.log('New logs received:', data.count);
       
@@ -101,6 +115,8 @@ function App() {
       socket.off('connect');
       socket.off('disconnect');
       socket.off('new_alerts');
+      socket.off('alert_updates');
+      socket.off('incidents');
       socket.off('new_logs');
       socket.off('stats_update');
     };
@@ -144,7 +160,8 @@ function App() {
         by_type: statsData.by_type || {},
         critical_count: statsData.critical_count || 0,
         high_count: statsData.high_count || 0,
-        medium_count: statsData.medium_count || 0
+        medium_count: statsData.medium_count || 0,
+        origins: statsData.origins
       });
       
       setTimeline(timelineRes.data || []);
@@ -46,6 +46,9 @@ function AlertPanel({ alerts }) {
               <div className="flex justify-between items-start mb-4">
                 <h3 className="text-sm font-semibold text-white">
                   {alert.type.replace(/_/g, ' ')}
+                  {alert.count > 1 && (
+                    <span className="ml-2 text-xs font-normal text-slate-400">x{alert.count}</span>
+                  )}
                 </h3>
                 <span className={`px-2 py-0.5 rounded text-xs font-medium ${
                   alert.severity === 'CRITICAL' 
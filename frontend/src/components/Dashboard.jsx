@@ -56,6 +56,26 @@ function Dashboard({ stats, alerts, logs }) {
         <ThreatChart stats={stats} alerts={alerts} />
       </div>
 
+      {/* Attack Origins */}
+      {stats.origins && stats.origins.top.ip_address.length > 0 && (
+        <div className="bg-slate-800 rounded border border-slate-700 p-5 flex-shrink-0">
+          <div className="flex justify-between items-center mb-4">
+            <h2 className="text-base font-semibold text-white uppercase tracking-wide">Top Attacker IPs</h2>
+            <span className="text-xs text-slate-400">
+              ~{stats.origins.unique.ip_address} IPs, ~{stats.origins.unique.username} users, ~{stats.origins.unique.source} sources
+            </span>
+          </div>
+          <div className="grid grid-cols-1 md:grid-cols-5 gap-3">
+            {stats.origins.top.ip_address.slice(0, 5).map(([ip, count]) => (
+              <div key={ip} className="bg-slate-900 rounded border border-slate-700 p-3">
+                <div className="text-xs text-white font-mono mb-1">{ip}</div>
+                <div className="text-xs text-slate-400">{count} alerts</div>
+              </div>
+            ))}
+          </div>
+        </div>
+      )}
+
       {/* Recent Alerts */}
       <div className="bg-slate-800 rounded border border-slate-700 p-5 flex-1 min-h-0 flex flex-col">
         <h2 className="text-base font-semibold text-white mb-4 uppercase tracking-wide">Recent Alerts</h2>